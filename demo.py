@@ -3,8 +3,7 @@ import matplotlib.pyplot as plt
 
 from models import MagnetoCoriolis
 from operators.polynomials import SphericalHarmonicMode
-from operators.worland_transform import WorlandTransform
-from operators.associated_legendre_transform import AssociatedLegendreTransformSingleM
+from operators.transform_registry import worland_transform, legendre_transform
 from fields import VectorFieldSingleM
 from utils import single_eig
 
@@ -27,11 +26,12 @@ bsp.normalise(norm)
 # construct physical transforms at physical grids
 rg = np.linspace(0, 1, 201)
 tg = np.linspace(0, np.pi/2, 201)
-worland_transform = WorlandTransform(nr, maxnl, m, r_grid=rg)
-legendre_transform = AssociatedLegendreTransformSingleM(maxnl, m, tg)
+# (shared instances, repeated calls at the same resolution and grids reuse the tables)
+wt = worland_transform(nr, maxnl, m, r_grid=rg)
+lt = legendre_transform(maxnl, m, tg)
 # compute physical fields
-uphy = usp.physical_field(worland_transform, legendre_transform)
-bphy = bsp.physical_field(worland_transform, legendre_transform)
+uphy = usp.physical_field(wt, lt)
+bphy = bsp.physical_field(wt, lt)
 
 # visualise field components
 fig, axes = plt.subplots(figsize=(12, 8), ncols=3, nrows=2, sharey=True, sharex=True)
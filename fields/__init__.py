@@ -1,2 +1,2 @@
 from fields.physical import MeridionalSlice
-from fields.spectrum import SpectralComponentSingleM, VectorFieldSingleM
+from fields.spectrum import SpectralComponentSingleM, VectorFieldSingleM, VectorFieldBatchSingleM
@@ -3,8 +3,6 @@ from dataclasses import dataclass
 from abc import ABC
 from typing import Callable, Dict, Union, List, Literal
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.axes_grid1 import make_axes_locatable
 from utils import Timer
 
 
@@ -224,6 +222,7 @@ class CMBSlice(ABC):
                   phase: float = 0.,
                   field_name: str = '',
                   **kwargs):
+        import matplotlib.pyplot as plt
         pg = np.linspace(-np.pi, np.pi, nphi+1)
         field = self.at_cmb(pg, phase=phase)[component]
         lon, lat = np.meshgrid(pg, np.pi/2-self.tg)
@@ -348,6 +347,8 @@ def visu_component(X1, X2,
     """
     Visualise one component
     """
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.axes_grid1 import make_axes_locatable
     if 'ax' in kwargs:
         ax = kwargs['ax']
     else:
@@ -389,6 +390,7 @@ def visu_components(X1, X2,
     """
     Visualise field components
     """
+    import matplotlib.pyplot as plt
     assert len(field) == 3, "Not 3 components field."
     if titles is not None:
         assert len(titles) == 3, "Number of titles is not 3."
@@ -452,6 +454,7 @@ def cylindrical_integration(data, rg, tg, sg, n, average=False, kind='cubic') ->
 
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
     from spectrum import SpectralComponentSingleM
     from operators.worland_transform import WorlandTransform
     from operators.associated_legendre_transform import AssociatedLegendreTransformSingleM
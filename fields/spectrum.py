@@ -1,13 +1,17 @@
+import warnings
 from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import List, Tuple, Dict, Callable
 
 import numpy as np
 
 from operators.worland_transform import WorlandTransform
 from operators.associated_legendre_transform import AssociatedLegendreTransformSingleM
+from operators import transform_registry
 from fields.physical import MeridionalSlice, EquatorialSlice, CMBSlice
 from operators.polynomials import *
 from utils import *
+from ordering import index as spectral_index, ln_index, component_parity_idx, vector_parity_idx
 
 
 class _SpectrumOrderingBase(ABC):
@@ -43,7 +47,15 @@ class SpectrumOrderingSingleM(_SpectrumOrderingBase):
         self._dim = self.nr * (self.maxnl-self.m)
 
     def index(self, l, n):
-        return (l - self.m) * self.nr + n
+        return spectral_index(self.nr, self.m, l, n)
+
+    @property
+    def ln(self):
+        """ degrees l and radial indices n of all coefficients """
+        return ln_index(self.nr, self.maxnl, self.m)
+
+    def parity_idx(self, component: str, parity: str):
+        return component_parity_idx(self.nr, self.maxnl, self.m, component, parity)
 
     def mode_l(self, l):
         return self.index(l, 0), self.index(l, self.nr-1) + 1
@@ -53,6 +65,170 @@ class SpectrumOrderingSingleM(_SpectrumOrderingBase):
         return self._dim
 
 
+@lru_cache(maxsize=128)
+def resample_map(res0: Tuple[int, int], res1: Tuple[int, int], m: int, vector: bool = False, parity: str = None):
+    """
+    Index map between the spectra of two resolutions res = (nr, maxnl) at m: the coefficients (l, n) present in both
+    are at src in the first and at dst in the second. Cached per resolution pair, the arrays are read-only.
+
+    Parameters
+    -----
+    vector: maps vector fields, toroidal then poloidal coefficients, instead of a single component
+
+    parity: 'DP' or 'QP', maps the parity-restricted layout of vector fields, see vector_parity_idx
+    """
+    (nr0, maxnl0), (nr1, maxnl1) = res0, res1
+    ls, ns = ln_index(min(nr0, nr1), min(maxnl0, maxnl1), m)
+    src, dst = spectral_index(nr0, m, ls, ns), spectral_index(nr1, m, ls, ns)
+    if vector or parity is not None:
+        dim0, dim1 = nr0 * (maxnl0 - m), nr1 * (maxnl1 - m)
+        src, dst = np.concatenate([src, src + dim0]), np.concatenate([dst, dst + dim1])
+    if parity is not None:
+        # positions in the restricted layouts, the parity of (l, n) does not depend on the resolution
+        pos0 = np.full(2 * dim0, -1)
+        pos0[vector_parity_idx(nr0, maxnl0, m, parity)] = np.arange(dim0)
+        pos1 = np.full(2 * dim1, -1)
+        pos1[vector_parity_idx(nr1, maxnl1, m, parity)] = np.arange(dim1)
+        kept = pos0[src] >= 0
+        src, dst = pos0[src[kept]], pos1[dst[kept]]
+    src.flags.writeable = False
+    dst.flags.writeable = False
+    return src, dst
+
+
+def resample_spectrum(data: np.ndarray, res0: Tuple[int, int], res1: Tuple[int, int], m: int,
+                      vector: bool = False, parity: str = None):
+    """
+    Pad with zeros or truncate spectra from the resolution res0 = (nr, maxnl) to res1, for data of shape (dim0,)
+    or (dim0, k), see resample_map for the layouts
+    """
+    src, dst = resample_map(tuple(res0), tuple(res1), m, vector, parity)
+    nr1, maxnl1 = res1
+    dim1 = nr1 * (maxnl1 - m) * (2 if vector and parity is None else 1)
+    out = np.zeros((dim1,) + data.shape[1:], dtype=data.dtype)
+    out[dst] = data[src]
+    return out
+
+
+def energy_spectra(nr, maxnl, m, component, data):
+    """
+    Energy spectra in l of one or several spectra of a single component, from the cached energy blocks,
+    as one batched product over l.
+
+    Parameters
+    -----
+    data: spectral coefficients, of shape (dim,) or (dim, k) for k spectra, e.g. a block of eigenvectors
+
+    Returns
+    -----
+        np.ndarray
+        energy spectra of shape (maxnl-m,) or (maxnl-m, k), summing over axis 0 gives the energies
+    """
+    factor = 1 if m == 0 else 2
+    coe = np.ascontiguousarray(data).reshape(maxnl - m, nr, -1)
+    if np.iscomplexobj(coe):
+        # real blocks times complex coefficients, without casting the blocks to complex
+        mc = np.matmul(energy_blocks(nr, maxnl, m, component), coe.view(np.float64)).view(coe.dtype)
+    else:
+        mc = np.matmul(energy_blocks(nr, maxnl, m, component), coe)
+    quad = np.real(coe.conj() * mc).sum(axis=1)
+    return factor * quad.reshape((maxnl - m,) + data.shape[1:])
+
+
+def vector_energy_spectra(nr, maxnl, m, data):
+    """
+    Energy spectra in l of one or several vector fields, data of shape (2*dim,) or (2*dim, k) holding the toroidal
+    then the poloidal coefficients, as for VectorFieldSingleM
+    """
+    dim = data.shape[0] // 2
+    return energy_spectra(nr, maxnl, m, 'tor', data[:dim]) + energy_spectra(nr, maxnl, m, 'pol', data[dim:])
+
+
+def _radial_pointwise(op, spectrum):
+    """ sum_n op[l, p, n] spectrum[l, n] as (n_points, L), for a real (L, n_points, nr) operator """
+    coe = np.ascontiguousarray(spectrum).reshape(op.shape[0], op.shape[2])
+    if np.iscomplexobj(coe):
+        return np.matmul(op, coe.view(np.float64).reshape(op.shape[0], op.shape[2], 2)).view(coe.dtype)[..., 0].T
+    return np.matmul(op, coe[..., None])[..., 0].T
+
+
+def _fold_pointwise(table, coe, even, sign):
+    """
+    sum_l table[p, l] coe[p, l] at the points p and at their mirror images about the equator, sign being the parity
+    of the table for even (l+m)
+    """
+    e = (table[:, even] * coe[:, even]).sum(axis=1)
+    o = (table[:, ~even] * coe[:, ~even]).sum(axis=1)
+    return e + o, sign * (e - o)
+
+
+def _deprecated_n_jobs(n_jobs):
+    """ n_jobs used to set the number of parallel jobs over the cylinders, which are now evaluated in one pass """
+    if n_jobs != -1:
+        warnings.warn("n_jobs has no effect and will be removed, the cylinders are evaluated in a single pass",
+                      DeprecationWarning, stacklevel=3)
+
+
+def _cylinder_fields(nr, maxnl, m, spectra, sg, zorder, chunk_size=None):
+    """
+    The s, phi and z components of a field on the Gauss-Legendre points in z of the cylinders of radii sg.
+
+    Only the points z > 0 are evaluated, in a single pass over chunks of about chunk_size points. The points z < 0
+    follow from the symmetry of r and of the associated Legendre functions about the equator.
+
+    Parameters
+    -----
+    spectra: Dict {'tor': ndarray, 'pol': ndarray}, the spectra of the components, either may be omitted
+
+    Returns
+    -----
+        Dict {str: (ndarray, ndarray)}, Gauss-Legendre weights
+        the components at z > 0 and at the mirror points z < 0, each of shape (ns, zorder/2), and the weights of
+        these points, so that the integral of f in z over [-1, 1] is f_north @ weights + f_south @ weights
+    """
+    x, w = np.polynomial.legendre.leggauss(zorder)
+    zh, wh = x[zorder // 2:], w[zorder // 2:]
+    ns, nh = sg.shape[0], zh.shape[0]
+    ls = np.arange(m, maxnl)
+    even = (ls + m) % 2 == 0
+    families = (['W'] if 'tor' in spectra else []) + (['divrW', 'divrdiffrW'] if 'pol' in spectra else [])
+    if chunk_size is None:
+        chunk_size = max(1, 2**22 // (len(families) * (maxnl - m) * nr))
+    step = max(1, chunk_size // nh)
+
+    fields = {comp: (np.zeros((ns, nh), dtype=np.complex128), np.zeros((ns, nh), dtype=np.complex128))
+              for comp in ['s', 'phi', 'z']}
+    for a in range(0, ns, step):
+        s = sg[a:a + step].reshape(-1, 1)
+        zg = zh * np.sqrt(1 - s**2)
+        rg = np.sqrt(s**2 + zg**2)
+        tg = np.arccos(zg / rg).reshape(-1)
+        ops = worland_operators(nr, ls, rg.reshape(-1), families)
+        plm, plmdivsin, dthetaplm = legendre_tables(m, maxnl - 1, tg)
+
+        r_comp, theta_comp, phi_comp = [np.zeros((2, tg.shape[0]), dtype=np.complex128) for _ in range(3)]
+        if 'tor' in spectra:
+            radial = _radial_pointwise(ops['W'], spectra['tor'])
+            theta_comp += 1.0j * m * np.array(_fold_pointwise(plmdivsin, radial, even, 1))
+            phi_comp -= np.array(_fold_pointwise(dthetaplm, radial, even, -1))
+        if 'pol' in spectra:
+            radial1 = _radial_pointwise(ops['divrW'], spectra['pol'])
+            radial2 = _radial_pointwise(ops['divrdiffrW'], spectra['pol'])
+            r_comp += np.array(_fold_pointwise(plm, radial1 * (ls * (ls + 1)), even, 1))
+            theta_comp += np.array(_fold_pointwise(dthetaplm, radial2, even, -1))
+            phi_comp += 1.0j * m * np.array(_fold_pointwise(plmdivsin, radial2, even, 1))
+
+        # cos(theta) changes sign at the mirror points, sin(theta) does not
+        cos_t, sin_t = np.cos(tg) * np.array([[1], [-1]]), np.sin(tg)
+        cyl = {'s': cos_t * theta_comp + sin_t * r_comp,
+               'phi': phi_comp,
+               'z': -sin_t * theta_comp + cos_t * r_comp}
+        for comp, value in cyl.items():
+            for k in range(2):
+                fields[comp][k][a:a + step] = value[k].reshape(-1, nh)
+    return fields, wh
+
+
 @dataclass
 class SpectralComponentSingleM(ABC):
     """
@@ -105,14 +281,7 @@ class SpectralComponentSingleM(ABC):
         """
         ordering = SpectrumOrderingSingleM(nr, maxnl, m)
         sp = np.zeros((ordering.dim,), dtype=np.complex128)
-        a_idx, s_idx = parity_idx(nr, maxnl, m)
-        if component.lower() == 'pol':
-            idx = {'dp': a_idx, 'qp': s_idx}
-        elif component.lower() == 'tor':
-            idx = {'dp': s_idx, 'qp': a_idx}
-        else:
-            raise RuntimeError(f"Unknown component {component}, must be either 'pol' or 'tor'.")
-        sp[idx[parity]] = data
+        sp[component_parity_idx(nr, maxnl, m, component, parity)] = data
         return cls(nr, maxnl, m, component, sp)
 
     def mode_l(self, l):
@@ -123,16 +292,7 @@ class SpectralComponentSingleM(ABC):
         """
         Compute energy spectrum in l
         """
-        nr, maxnl, m = self.nr, self.maxnl, self.m
-        factor = 1 if m == 0 else 2
-        energy_spectrum = np.zeros(maxnl-m)
-        weight = energy_weight_tor if self.component == 'tor' else energy_weight_pol
-        for l in range(m, maxnl):
-            mat = weight(l, nr-1)
-            c = self.mode_l(l)
-            energy_spectrum[l-m] = factor*np.real(np.linalg.multi_dot([c.T, mat, c.conj()]))
-
-        self._energy_spectrum = energy_spectrum
+        self._energy_spectrum = energy_spectra(self.nr, self.maxnl, self.m, self.component, self.spectrum)
 
     def _physical_field(self,
                         worland_transform: WorlandTransform,
@@ -143,17 +303,17 @@ class SpectralComponentSingleM(ABC):
         nrg = worland_transform.r_grid.shape[0]
         ntg = legendre_transform.grid.shape[0]
         if self.component == 'tor':
-            radial = (worland_transform.operators['W'] @ self.spectrum).reshape(-1, nrg)
+            radial = worland_transform.to_grid('W', self.spectrum)
             r_comp = np.zeros((ntg, nrg))
-            theta_comp = 1.0j * m * legendre_transform._operators['plmdivsin'] @ radial
-            phi_comp = -legendre_transform._operators['dthetaplm'] @ radial
+            theta_comp = 1.0j * m * legendre_transform.to_grid('plmdivsin', radial)
+            phi_comp = -legendre_transform.to_grid('dthetaplm', radial)
         elif self.component == 'pol':
-            radial1 = (worland_transform.operators['divrW'] @ self.spectrum).reshape(-1, nrg)
-            radial2 = (worland_transform.operators['divrdiffrW'] @ self.spectrum).reshape(-1, nrg)
-            l_factor = scsp.diags([l * (l + 1) for l in range(m, maxnl)])
-            r_comp = legendre_transform._operators['plm'] @ l_factor @ radial1
-            theta_comp = legendre_transform._operators['dthetaplm'] @ radial2
-            phi_comp = 1.0j * m * legendre_transform._operators['plmdivsin'] @ radial2
+            radial1 = worland_transform.to_grid('divrW', self.spectrum)
+            radial2 = worland_transform.to_grid('divrdiffrW', self.spectrum)
+            ls = np.arange(m, maxnl)
+            r_comp = legendre_transform.to_grid('plm', (ls * (ls + 1))[:, None] * radial1)
+            theta_comp = legendre_transform.to_grid('dthetaplm', radial2)
+            phi_comp = 1.0j * m * legendre_transform.to_grid('plmdivsin', radial2)
         else:
             raise RuntimeError(f"Unknown component {self.component}, must be either 'pol' or 'tor'.")
         return {'r': r_comp, 'theta': theta_comp, 'phi': phi_comp}
@@ -176,8 +336,8 @@ class SpectralComponentSingleM(ABC):
         Compute physical fields at CMB
         """
         tg = np.linspace(0, np.pi/2, ntg) if half_cmb else np.linspace(0, np.pi, ntg)
-        worland_transform = WorlandTransform(self.nr, self.maxnl, self.m, r_grid=np.array([1.0]))
-        legendre_transform = AssociatedLegendreTransformSingleM(self.maxnl, self.m, tg)
+        worland_transform = transform_registry.worland_transform(self.nr, self.maxnl, self.m, r_grid=np.array([1.0]))
+        legendre_transform = transform_registry.legendre_transform(self.maxnl, self.m, tg)
         field = self._physical_field(worland_transform, legendre_transform)
         return CMBSlice(field, self.m, tg)
 
@@ -187,7 +347,7 @@ class SpectralComponentSingleM(ABC):
         """
         Compute the field at a equatorial slice.
         """
-        legendre_transform = AssociatedLegendreTransformSingleM(self.maxnl, self.m, np.array([np.pi/2]))
+        legendre_transform = transform_registry.legendre_transform(self.maxnl, self.m, np.array([np.pi/2]))
         field = self._physical_field(worland_transform, legendre_transform)
         return EquatorialSlice(field, self.m, worland_transform.r_grid)
 
@@ -204,11 +364,8 @@ class SpectralComponentSingleM(ABC):
         sg: np.ndarray
             The grids in s for calculation the cylindrical average
 
-        n_jobs: int
-            Number of processors for embarrassingly parallel using joblib.
-
         kwargs:
-            One can set `verbose`, `batch_size` for joblib Parallel
+            One can set `chunk_size`, the number of points evaluated at once,
             also can set `interp_kind` for the returned 1d function
 
         Returns
@@ -217,88 +374,17 @@ class SpectralComponentSingleM(ABC):
             Cylindrical average of s, phi, z components, as 1d interpolation functions
 
         """
+        _deprecated_n_jobs(n_jobs)
         nr, maxnl, m = self.nr, self.maxnl, self.m
         zorder = nr + maxnl // 2
         zorder += zorder % 2 + 8
-        x, w = np.polynomial.legendre.leggauss(zorder)
+        fields, weight = _cylinder_fields(nr, maxnl, m, {self.component: self.spectrum}, sg, zorder,
+                                          kwargs.get('chunk_size', None))
 
-        if self.component == 'tor':
-            def integrate(s):
-                zg = x * np.sqrt(1 - s**2)
-                rg = np.sqrt(s**2+zg**2)
-                tg = np.arccos(zg/rg)
-                legendre_transform = AssociatedLegendreTransformSingleM(maxnl, m, tg)
-
-                radial = self._Wtransform(self.spectrum, nr, maxnl, m, rg)
-                theta_comp = (1.0j * m * legendre_transform._operators['plmdivsin'] * radial).sum(axis=1)
-                phi_comp = (-legendre_transform._operators['dthetaplm'] * radial).sum(axis=1)
-
-                s_comp = np.cos(tg)*theta_comp
-                z_comp = -np.sin(tg)*theta_comp
-                return [0.5*(s_comp*w).sum(), 0.5*(phi_comp*w).sum(), 0.5*(z_comp*w).sum()]
-        if self.component == "pol":
-            def integrate(s):
-                zg = x * np.sqrt(1 - s**2)
-                rg = np.sqrt(s**2+zg**2)
-                tg = np.arccos(zg/rg)
-                legendre_transform = AssociatedLegendreTransformSingleM(maxnl, m, tg)
-
-                radial1 = self._divrWtransform(self.spectrum, nr, maxnl, m, rg)
-                radial2 = self._divrdiffrWtransform(self.spectrum, nr, maxnl, m, rg)
-                l_factor = scsp.diags([l * (l + 1) for l in range(m, maxnl)])
-                r_comp = (legendre_transform._operators['plm'] * np.array(radial1 @ l_factor)).sum(axis=1)
-                theta_comp = (legendre_transform._operators['dthetaplm'] * radial2).sum(axis=1)
-                phi_comp = (1.0j * m * legendre_transform._operators['plmdivsin'] * radial2).sum(axis=1)
-
-                s_comp = np.cos(tg) * theta_comp + np.sin(tg)*r_comp
-                z_comp = -np.sin(tg) * theta_comp + np.cos(tg)*r_comp
-                return [0.5*(s_comp*w).sum(), 0.5*(phi_comp*w).sum(), 0.5*(z_comp*w).sum()]
-
-        from joblib import Parallel, delayed
         from scipy.interpolate import interpolate
-        tmp = np.array(Parallel(n_jobs=n_jobs,
-                                verbose=kwargs.get('verbose', 0),
-                                batch_size=kwargs.get('batch_size', 1))(delayed(integrate)(s) for s in sg))
         kind = kwargs.get('interp_kind', 'cubic')
-        return {'s': interpolate.interp1d(sg, tmp[:, 0], kind=kind),
-                'phi': interpolate.interp1d(sg, tmp[:, 1], kind=kind),
-                'z': interpolate.interp1d(sg, tmp[:, 2], kind=kind)}
-
-    @staticmethod
-    def _Wtransform(spectrum, nr, maxnl, m, rg):
-        radial = np.full((maxnl-m, rg.shape[0]), fill_value=np.NaN, dtype=np.complex128)
-        for l in range(m, maxnl):
-            poly = worland(nr, l, rg)
-            a, b = (l-m)*nr, (l-m+1)*nr
-            radial[l-m, :] = poly @ spectrum[a:b]
-        return radial.T
-
-    @staticmethod
-    def _divrWtransform(spectrum, nr, maxnl, m, rg):
-        radial = np.full((maxnl - m, rg.shape[0]), fill_value=np.NaN, dtype=np.complex128)
-        for l in range(m, maxnl):
-            poly = divrW(nr, l, rg)
-            a, b = (l - m) * nr, (l - m + 1) * nr
-            radial[l - m, :] = poly @ spectrum[a:b]
-        return radial.T
-
-    @staticmethod
-    def _divrdiffrWtransform(spectrum, nr, maxnl, m, rg):
-        radial = np.full((maxnl - m, rg.shape[0]), fill_value=np.NaN, dtype=np.complex128)
-        for l in range(m, maxnl):
-            poly = divrdiffrW(nr, l, rg)
-            a, b = (l - m) * nr, (l - m + 1) * nr
-            radial[l - m, :] = poly @ spectrum[a:b]
-        return radial.T
-
-    @staticmethod
-    def _laplacianlWtransform(spectrum, nr, maxnl, m, rg):
-        radial = np.full((maxnl - m, rg.shape[0]), fill_value=np.NaN, dtype=np.complex128)
-        for l in range(m, maxnl):
-            poly = laplacianlW(nr, l, rg)
-            a, b = (l - m) * nr, (l - m + 1) * nr
-            radial[l - m, :] = poly @ spectrum[a:b]
-        return radial.T
+        return {comp: interpolate.interp1d(sg, 0.5 * (north @ weight + south @ weight), kind=kind)
+                for comp, (north, south) in fields.items()}
 
     def normalise(self, factor):
         self.data /= factor
@@ -311,47 +397,29 @@ class SpectralComponentSingleM(ABC):
         if self.component == "tor":
             self.component = "pol"
         else:
-            nr, maxnl, m = self.nr, self.maxnl, self.m
-            for l in range(m, maxnl):
-                n_grid = nr + maxnl // 2 + 10
-                rg = worland_grid(n_grid)
-                weight = scsp.diags(np.ones(n_grid) * worland_weight(n_grid))
-                poly = worland(nr, l, rg)
-                lapl_poly = laplacianlW(nr, l, rg)
-                a, b = (l - m) * nr, (l - m + 1) * nr
-                self.spectrum[a:b] = -poly.T @ weight @ lapl_poly.dot(self.spectrum[a:b])
+            self.spectrum[:] = -(laplacian_matrix(self.nr, self.maxnl, self.m) @ self.spectrum)
             self.component = "tor"
+        self.calculate_energy()
         return self
 
     def restrict_parity(self, parity: str):
         """
         Set the spectrum of certain parity to be zero
         """
-        parity = parity.lower()
-        nr, maxnl, m = self.nr, self.maxnl, self.m
-        a_idx, s_idx = parity_idx(nr, maxnl, m)
-        if self.component == 'pol':
-            idx = {'dp': a_idx, 'qp': s_idx}
-        else:
-            idx = {'dp': s_idx, 'qp': a_idx}
-        self.spectrum[idx[parity]] = 0
+        self.spectrum[component_parity_idx(self.nr, self.maxnl, self.m, self.component, parity)] = 0
 
     def padding(self, nr, maxnl):
         """
         Pad to higher resolution
         """
-        c0 = self.spectrum
-        nr0, maxnl0, m = self.nr, self.maxnl, self.m
-        idx = []
-        k = 0
-        for l in range(m, maxnl0):
-            for n in range(nr):
-                if n < nr0:
-                    idx.append(k)
-                k += 1
-        c = np.zeros(nr*(maxnl-m), dtype=c0.dtype)
-        c[idx] = c0
-        return SpectralComponentSingleM(nr, maxnl, m, self.component, c)
+        return self.resample(nr, maxnl)
+
+    def resample(self, nr, maxnl):
+        """
+        Pad with zeros or truncate to another resolution
+        """
+        c = resample_spectrum(self.spectrum, (self.nr, self.maxnl), (nr, maxnl), self.m)
+        return SpectralComponentSingleM(nr, maxnl, self.m, self.component, c)
 
     @property
     def energy(self):
@@ -409,12 +477,8 @@ class VectorFieldSingleM:
         """
         Construction from spectral coefficients for a given parity
         """
-        a_idx, s_idx = parity_idx(nr, maxnl, m)
-        dim = nr*(maxnl-m)
-        coe = np.zeros(2*dim, dtype=data.dtype)
-        toridx, polidx = (a_idx, s_idx+dim) if parity.lower() == 'qp' else (s_idx, a_idx+dim)
-        coe[toridx] = data[:len(toridx)]
-        coe[polidx] = data[len(toridx):]
+        coe = np.zeros(2*nr*(maxnl-m), dtype=data.dtype)
+        coe[vector_parity_idx(nr, maxnl, m, parity)] = data
         return cls(nr, maxnl, m, coe)
 
     def physical_field(self,
@@ -471,6 +535,15 @@ class VectorFieldSingleM:
         """
         for comp in self.components.keys():
             self.components[comp] = self.components[comp].padding(nr, maxnl)
+        self.nr, self.maxnl = nr, maxnl
+        self.data = self.spectrum
+
+    def resample(self, nr, maxnl):
+        """
+        Pad with zeros or truncate to another resolution, as a new field
+        """
+        data = resample_spectrum(self.spectrum, (self.nr, self.maxnl), (nr, maxnl), self.m, vector=True)
+        return VectorFieldSingleM(nr, maxnl, self.m, data)
 
     def cylindrical_average(self,
                             sg,
@@ -481,51 +554,23 @@ class VectorFieldSingleM:
         Compute cylindrical average of s, phi, z components and square of them
         (can be used to compute columnarity)
         """
+        _deprecated_n_jobs(n_jobs)
         # first need to integrate u_s**2 + u_phi**2 on cylinder
         ordering = self.components['tor'].ordering
         nr, maxnl, m = ordering.nr, ordering.maxnl, ordering.m
         zorder = 2*nr + maxnl
         zorder += zorder % 2 + 8
-        x, w = np.polynomial.legendre.leggauss(zorder)
-
-        def integrate(s):
-            zg = x * np.sqrt(1 - s ** 2)
-            rg = np.sqrt(s ** 2 + zg ** 2)
-            tg = np.arccos(zg / rg)
-            legendre_transform = AssociatedLegendreTransformSingleM(maxnl, m, tg)
-            # toroidal
-            radial = self.components['tor']._Wtransform(self.components['tor'].spectrum, nr, maxnl, m, rg)
-            theta_comp = (1.0j * m * legendre_transform._operators['plmdivsin'] * radial).sum(axis=1)
-            phi_comp = (-legendre_transform._operators['dthetaplm'] * radial).sum(axis=1)
-            # poloidal
-            radial1 = self.components['pol']._divrWtransform(self.components['pol'].spectrum, nr, maxnl, m, rg)
-            radial2 = self.components['tor']._divrdiffrWtransform(self.components['pol'].spectrum, nr, maxnl, m, rg)
-            l_factor = scsp.diags([l * (l + 1) for l in range(m, maxnl)])
-            r_comp = (legendre_transform._operators['plm'] * np.array(radial1 @ l_factor)).sum(axis=1)
-            theta_comp += (legendre_transform._operators['dthetaplm'] * radial2).sum(axis=1)
-            phi_comp += (1.0j * m * legendre_transform._operators['plmdivsin'] * radial2).sum(axis=1)
-
-            s_comp = np.cos(tg) * theta_comp + np.sin(tg) * r_comp
-            z_comp = -np.sin(tg) * theta_comp + np.cos(tg) * r_comp
-            s_comp2 = np.abs(s_comp)**2
-            phi_comp2 = np.abs(phi_comp)**2
-            z_comp2 = np.abs(z_comp)**2
-            return [0.5 * (s_comp * w).sum(), 0.5 * (phi_comp * w).sum(), 0.5 * (z_comp * w).sum(),
-                    0.5 * (s_comp2 * w).sum(), 0.5 * (phi_comp2 * w).sum(), 0.5 * (z_comp2 * w).sum()]
-
-        from joblib import Parallel, delayed
+        spectra = {comp: self.components[comp].spectrum for comp in ['tor', 'pol']}
+        fields, weight = _cylinder_fields(nr, maxnl, m, spectra, sg, zorder, kwargs.get('chunk_size', None))
+
         from scipy.interpolate import interpolate
-        tmp = np.array(Parallel(n_jobs=n_jobs,
-                                verbose=kwargs.get('verbose', 0),
-                                batch_size=kwargs.get('batch_size', 1))(delayed(integrate)(s) for s in sg))
         kind = kwargs.get('interp_kind', 'cubic')
-        return {'s': interpolate.interp1d(sg, tmp[:, 0], kind=kind),
-                'phi': interpolate.interp1d(sg, tmp[:, 1], kind=kind),
-                'z': interpolate.interp1d(sg, tmp[:, 2], kind=kind),
-                's_square': interpolate.interp1d(sg, tmp[:, 3], kind=kind),
-                'phi_square': interpolate.interp1d(sg, tmp[:, 4], kind=kind),
-                'z_square': interpolate.interp1d(sg, tmp[:, 5], kind=kind)
-                }
+        average = {comp: interpolate.interp1d(sg, 0.5 * (north @ weight + south @ weight), kind=kind)
+                   for comp, (north, south) in fields.items()}
+        for comp, (north, south) in fields.items():
+            average[comp + '_square'] = interpolate.interp1d(
+                sg, 0.5 * (np.abs(north)**2 @ weight + np.abs(south)**2 @ weight), kind=kind)
+        return average
 
     @property
     def energy(self):
@@ -540,12 +585,157 @@ class VectorFieldSingleM:
         return np.concatenate([self.components['tor'].spectrum, self.components['pol'].spectrum])
 
 
+@dataclass
+class VectorFieldBatchSingleM:
+    """
+    Class for a batch of k vector fields at single m, e.g. the eigenvectors of a spectrum, processed together
+
+    nr: number of radial modes, starting from 0
+
+    maxnl: maximal spherical harmonic degree L + 1 = maxnl
+
+    m: azimuthal wave number
+
+    data: spectrum coefficients of shape (2*dim, k), each column as for VectorFieldSingleM
+
+    """
+    nr: int
+    maxnl: int
+    m: int
+    data: np.ndarray = field(repr=False)
+
+    def __post_init__(self):
+        self.ordering = SpectrumOrderingSingleM(self.nr, self.maxnl, self.m)
+        if self.data.ndim != 2 or self.data.shape[0] != 2 * self.ordering.dim:
+            raise RuntimeError("Data shape does not match input resolution")
+        self._energy_spectrum = vector_energy_spectra(self.nr, self.maxnl, self.m, self.data)
+
+    @classmethod
+    def from_parity_spectrum(cls, nr, maxnl, m,
+                             data: np.ndarray,
+                             parity: str):
+        """
+        Construction from spectral coefficients for a given parity, data of shape (n, k)
+        """
+        coe = np.zeros((2 * nr * (maxnl - m), data.shape[1]), dtype=data.dtype)
+        coe[vector_parity_idx(nr, maxnl, m, parity)] = data
+        return cls(nr, maxnl, m, coe)
+
+    def __len__(self):
+        return self.data.shape[1]
+
+    def __getitem__(self, i) -> VectorFieldSingleM:
+        return VectorFieldSingleM(self.nr, self.maxnl, self.m, self.data[:, i].copy())
+
+    def component(self, comp: str):
+        """ (dim, k) coefficients of the toroidal or poloidal component """
+        dim = self.ordering.dim
+        return self.data[:dim] if comp == 'tor' else self.data[dim:]
+
+    def _physical_field(self,
+                        worland_transform: WorlandTransform,
+                        legendre_transform: AssociatedLegendreTransformSingleM
+                        ) -> Dict[str, np.ndarray]:
+        """ components of shape (k, n_theta, n_r), every transform being a single product over all k fields """
+        m = self.m
+        ls = np.arange(m, self.maxnl).reshape(-1, 1, 1)
+        tor, pol = self.component('tor'), self.component('pol')
+        radial = worland_transform.to_grid('W', tor)
+        radial1 = worland_transform.to_grid('divrW', pol)
+        radial2 = worland_transform.to_grid('divrdiffrW', pol)
+        field = {'r': legendre_transform.to_grid('plm', ls * (ls + 1) * radial1),
+                 'theta': 1.0j * m * legendre_transform.to_grid('plmdivsin', radial) +
+                          legendre_transform.to_grid('dthetaplm', radial2),
+                 'phi': -legendre_transform.to_grid('dthetaplm', radial) +
+                        1.0j * m * legendre_transform.to_grid('plmdivsin', radial2)}
+        return {comp: np.moveaxis(value, -1, 0) for comp, value in field.items()}
+
+    def physical_field(self,
+                       worland_transform: WorlandTransform,
+                       legendre_transform: AssociatedLegendreTransformSingleM
+                       ) -> MeridionalSlice:
+        """
+        Compute the physical fields of all k fields, as a MeridionalSlice whose components are stacked
+        arrays of shape (k, n_theta, n_r)
+        """
+        field = self._physical_field(worland_transform, legendre_transform)
+        return MeridionalSlice(field, self.m, worland_transform.r_grid, legendre_transform.grid)
+
+    def cmb_slice(self,
+                  ntg: int,
+                  half_cmb: bool = True
+                  ) -> List[CMBSlice]:
+        """
+        Compute physical fields at CMB, computed together and returned as one CMBSlice per field
+        """
+        tg = np.linspace(0, np.pi/2, ntg) if half_cmb else np.linspace(0, np.pi, ntg)
+        worland_transform = transform_registry.worland_transform(self.nr, self.maxnl, self.m, r_grid=np.array([1.0]))
+        legendre_transform = transform_registry.legendre_transform(self.maxnl, self.m, tg)
+        field = self._physical_field(worland_transform, legendre_transform)
+        return [CMBSlice({comp: value[i, :, 0] for comp, value in field.items()}, self.m, tg)
+                for i in range(len(self))]
+
+    def equatorial_slice(self,
+                         worland_transform: WorlandTransform
+                         ) -> List[EquatorialSlice]:
+        """
+        Compute physical fields at the equatorial slice, computed together and returned as one EquatorialSlice per field
+        """
+        legendre_transform = transform_registry.legendre_transform(self.maxnl, self.m, np.array([np.pi/2]))
+        field = self._physical_field(worland_transform, legendre_transform)
+        return [EquatorialSlice({comp: value[i, 0, :] for comp, value in field.items()}, self.m,
+                                worland_transform.r_grid) for i in range(len(self))]
+
+    def curl(self):
+        """ Transform to curl of the fields """
+        self.data = curl_matrix(self.nr, self.maxnl, self.m) @ self.data
+        self._energy_spectrum = vector_energy_spectra(self.nr, self.maxnl, self.m, self.data)
+        return self
+
+    def normalise(self, factor):
+        """ divide by factor, a scalar or one value per field """
+        factor = np.asarray(factor)
+        self.data = self.data / factor
+        self._energy_spectrum = self._energy_spectrum / np.abs(factor)**2
+
+    def normalise_energy(self):
+        """ normalise every field to unit energy """
+        self.normalise(np.sqrt(self.energy))
+
+    def resample(self, nr, maxnl):
+        """
+        Pad with zeros or truncate all fields to another resolution, as a new batch
+        """
+        data = resample_spectrum(self.data, (self.nr, self.maxnl), (nr, maxnl), self.m, vector=True)
+        return VectorFieldBatchSingleM(nr, maxnl, self.m, data)
+
+    def restrict_parity(self, parity):
+        """
+        Set the spectrum of certain parity to be zero
+        """
+        idx = vector_parity_idx(self.nr, self.maxnl, self.m, parity)
+        self.data[idx] = 0
+        self._energy_spectrum = vector_energy_spectra(self.nr, self.maxnl, self.m, self.data)
+
+    @property
+    def energy(self):
+        return self._energy_spectrum.sum(axis=0)
+
+    @property
+    def energy_spectrum(self):
+        return self._energy_spectrum
+
+    @property
+    def spectrum(self):
+        return self.data
+
+
 if __name__ == "__main__":
     tor_sp = SpectralComponentSingleM.from_modes(21, 41, 1, 'tor', [(1, 1, 1), (2, 1, 1)])
     pol_sp = SpectralComponentSingleM.from_modes(21, 41, 1, 'pol', [(1, 1, 1), (2, 1, 1)])
     sp = VectorFieldSingleM.from_components(tor_sp, pol_sp)
     sg = np.linspace(0.0, 1, 101)
-    av = sp.cylindrical_average(sg, n_jobs=1)
+    av = sp.cylindrical_average(sg)
 
     def reference(s, c):
         from math import sqrt, pi, exp
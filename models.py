@@ -3,8 +3,9 @@ from dataclasses import dataclass
 from typing import Union, Dict
 
 from operators.equations import *
-from operators.worland_transform import WorlandTransform
+from operators.transform_registry import worland_transform
 from utils import *
+from ordering import vector_parity_idx
 
 
 @dataclass
@@ -118,7 +119,7 @@ class KinematicDynamo(_BaseModel):
 
     def __post_init__(self):
         super(KinematicDynamo, self).__post_init__()
-        self.transform = WorlandTransform(self.nr, self.maxnl, self.m, self.n_grid, require_curl=False)
+        self.transform = worland_transform(self.nr, self.maxnl, self.m, self.n_grid, require_curl=False)
         self.induction_eq = InductionEquation(self.nr, self.maxnl, self.m, **self.induction_eq_params)
 
     def setup_operator(self, flow_modes: List[SphericalHarmonicMode], setup_eigen=False, **kwargs):
@@ -222,7 +223,7 @@ class MagnetoCoriolis(_BaseModel):
         self._check_params()
 
         nr, maxnl, m = self.res
-        self.transform = WorlandTransform(nr, maxnl, m, self.n_grid, require_curl=True)
+        self.transform = worland_transform(nr, maxnl, m, self.n_grid, require_curl=True)
         self.induction_eq = InductionEquation(*self.res, **self.induction_eq_params)
         self.momentum_eq = MomentumEquation(*self.res, inviscid=self.inviscid, bc_type=self.bc_type)
         if self.induction_eq.galerkin:
@@ -237,27 +238,48 @@ class MagnetoCoriolis(_BaseModel):
     def setup_operator(self, field_modes: List[SphericalHarmonicMode],
                        flow_modes: Union[None, List[SphericalHarmonicMode]] = None, setup_eigen=False,
                        *args, **kwargs):
+        """
+        Setup operators of the problem. With parity='DP' or 'QP' (parity of b), only the operators of this
+        equatorial symmetry class are assembled, the parity of u being set by u_parity as in separate_parity.
+        With parity=True and setup_eigen, both classes are assembled directly and returned as (DP, QP) problems.
+        """
+        parity = kwargs.pop('parity', False)
+        if parity is True:
+            if not setup_eigen:
+                parity = None
+            else:
+                return tuple(self.setup_operator(field_modes, flow_modes, setup_eigen, *args, parity=b_parity, **kwargs)
+                             for b_parity in ('DP', 'QP'))
         if flow_modes is None:
             flow_modes = []
         nr, maxnl, m = self.res
         dim = nr*(maxnl - m)
+        if parity in ('DP', 'QP'):
+            b = parity
+            # magnetostrophic problem keeps the full u, which is eliminated anyway
+            u = None if kwargs.get('magnetic_ekman') == 0 else self.u_parity(b, kwargs.get('u_parity'))
+        else:
+            b, u = None, None
+        ng = int(self.induction_eq.galerkin)
         operators = {}
-        operators['lorentz'] = self.momentum_eq.lorentz(self.transform, field_modes, quasi_inverse=True)
+        operators['lorentz'] = self.momentum_eq.lorentz(self.transform, field_modes, quasi_inverse=True, parity=(u, b))
         if self.induction_eq.galerkin:
-            operators['lorentz'] = operators['lorentz'] @ self.induction_eq.stencil
+            operators['lorentz'] = operators['lorentz'] @ self.induction_eq.restrict(self.induction_eq.stencil,
+                                                                                     (b, b), (0, 1))
         operators['inductionB'] = self.induction_eq.induction(self.transform, field_modes, imposed_flow=False,
-                                                              quasi_inverse=True)
-        operators['advection'] = self.momentum_eq.advection(self.transform, flow_modes, quasi_inverse=True)
+                                                              quasi_inverse=True, parity=(b, u))
+        operators['advection'] = self.momentum_eq.advection(self.transform, flow_modes, quasi_inverse=True,
+                                                            parity=(u, u))
         operators['inductionU'] = self.induction_eq.induction(self.transform, flow_modes, imposed_flow=True,
-                                                              quasi_inverse=True)
-        operators['magnetic_diffusion'] = self.induction_eq.diffusion
-        operators['coriolis'] = self.momentum_eq.coriolis
+                                                              quasi_inverse=True, parity=(b, b))
+        operators['magnetic_diffusion'] = self.induction_eq.restrict(self.induction_eq.diffusion, (b, b), (ng, ng))
+        operators['coriolis'] = self.momentum_eq.restrict(self.momentum_eq.coriolis, (u, u))
         if self.inviscid:
-            operators['viscous_diffusion'] = scsp.csr_matrix((2*dim, 2*dim))
+            operators['viscous_diffusion'] = self.momentum_eq.restrict(scsp.csr_matrix((2*dim, 2*dim)), (u, u))
         else:
-            operators['viscous_diffusion'] = self.momentum_eq.diffusion
-        operators['induction_mass'] = self.induction_eq.mass
-        operators['momentum_mass'] = self.momentum_eq.mass
+            operators['viscous_diffusion'] = self.momentum_eq.restrict(self.momentum_eq.diffusion, (u, u))
+        operators['induction_mass'] = self.induction_eq.restrict(self.induction_eq.mass, (b, b), (ng, ng))
+        operators['momentum_mass'] = self.momentum_eq.restrict(self.momentum_eq.mass, (u, u))
         if setup_eigen:
             return self.setup_eigen_problem(operators, **kwargs)
         else:
@@ -300,18 +322,13 @@ class MagnetoCoriolis(_BaseModel):
     def separate_parity(self, A, B, b_parity, u_parity):
         nr, maxnl, m = self.res
         dimu = 2 * nr * (maxnl-m)
-        A = scsp.lil_matrix(A)
-        B = scsp.lil_matrix(B)
+        A = scsp.csr_matrix(A)
+        B = scsp.csr_matrix(B)
 
-        if u_parity is None:
-            row_idx = vector_parity_idx(nr, maxnl, m, b_parity, ngalerkin=int(self.induction_eq.galerkin))
-            col_idx = vector_parity_idx(nr, maxnl, m, b_parity, ngalerkin=int(self.induction_eq.galerkin))
-        else:
-            row_idx = np.append(vector_parity_idx(nr, maxnl, m, u_parity),
-                                dimu + vector_parity_idx(nr, maxnl, m, b_parity, ngalerkin=int(self.induction_eq.galerkin)))
-            col_idx = np.append(vector_parity_idx(nr, maxnl, m, u_parity),
-                                dimu + vector_parity_idx(nr, maxnl, m, b_parity, ngalerkin=int(self.induction_eq.galerkin)))
-        return scsp.csr_matrix(A[row_idx[:, None], col_idx]), scsp.coo_matrix(B[row_idx[:, None], col_idx])
+        idx = vector_parity_idx(nr, maxnl, m, b_parity, ngalerkin=int(self.induction_eq.galerkin))
+        if u_parity is not None:
+            idx = np.append(vector_parity_idx(nr, maxnl, m, u_parity), dimu + idx)
+        return scsp.csr_matrix(A[idx, :].tocsc()[:, idx]), scsp.coo_matrix(B[idx, :].tocsc()[:, idx])
 
     def u_parity(self, b_parity, relation):
         if relation == 'same':
@@ -4,26 +4,93 @@ from operators.polynomials import *
 from utils import Timer
 
 
+# sign picked up by each table under theta -> pi - theta, for even (l+m)
+_EVEN_SIGN = {'plm': 1, 'plmdivsin': 1, 'dthetaplm': -1}
+
+
 @dataclass
 class AssociatedLegendreTransformSingleM(ABC):
     """
     The transforms of associated Legendre functions from spectral space to physical space
+
+    When the grid is symmetric about the equator (grid[i] + grid[-1-i] = pi), the tables are only evaluated on the
+    first half of the grid, and the other half follows from P_l^m(pi - theta) = (-1)^(l+m) P_l^m(theta).
+    to_grid then evaluates the even and odd (l+m) parts on that half only.
     """
     maxnl: int
     m: int
     grid: np.ndarray = field(repr=False)
+    symmetric: bool = field(init=False, repr=False)
+    n_half: int = field(init=False, repr=False)
 
     def __post_init__(self):
-        self._operators = dict()
-        self._operators['plm'] = Plm(self.m, self.maxnl - 1, self.grid)
-        self._operators['plmdivsin'] = PlmDivSin(self.m, self.maxnl, self.grid)
-        self._operators['dthetaplm'] = DthetaPlm(self.m, self.maxnl - 1, self._operators['plm'],
-                                                 self._operators['plmdivsin'], self.grid)
-        self._operators['plmdivsin'] = self._operators['plmdivsin'][:, :-1]
+        ntg = self.grid.shape[0]
+        self.symmetric = ntg > 1 and bool(np.allclose(self.grid + self.grid[::-1], np.pi, rtol=0, atol=1e-12))
+        self.n_half = (ntg + 1) // 2 if self.symmetric else ntg
+        self._even = (np.arange(self.m, self.maxnl) + self.m) % 2 == 0
+        self._parts = dict()
+        tables = legendre_tables(self.m, self.maxnl - 1, self.grid[:self.n_half])
+        for name, table in zip(_EVEN_SIGN.keys(), tables):
+            self._parts[name, 'even'] = np.ascontiguousarray(table[:, self._even])
+            self._parts[name, 'odd'] = np.ascontiguousarray(table[:, ~self._even])
 
     @property
     def operators(self):
-        return self._operators
+        """ the tables (n_grid, L) on the full grid, built from the half tables on each access """
+        return {name: self._table(name) for name in _EVEN_SIGN}
+
+    def _table(self, name):
+        table = np.empty((self.n_half, self._even.shape[0]))
+        table[:, self._even] = self._parts[name, 'even']
+        table[:, ~self._even] = self._parts[name, 'odd']
+        if not self.symmetric:
+            return table
+        full = np.empty((self.grid.shape[0], table.shape[1]))
+        full[:self.n_half] = table
+        full[self.n_half:] = self._mirror(name, table)
+        return full
+
+    def _mirror(self, name, table):
+        """ the rows of the second half of the grid, from those of the first half """
+        sign = np.where(self._even, _EVEN_SIGN[name], -_EVEN_SIGN[name])
+        return (sign * table[:self.grid.shape[0] - self.n_half])[::-1]
+
+    def _fold(self, name, even, odd):
+        """ values on the full grid, from the even and odd (l+m) parts evaluated on the first half """
+        if not self.symmetric:
+            return even + odd
+        n_mirror = self.grid.shape[0] - self.n_half
+        out = np.empty((self.grid.shape[0],) + even.shape[1:], dtype=np.result_type(even, odd))
+        np.add(even, odd, out=out[:self.n_half])
+        south = out[self.n_half:][::-1]
+        if _EVEN_SIGN[name] > 0:
+            np.subtract(even[:n_mirror], odd[:n_mirror], out=south)
+        else:
+            np.subtract(odd[:n_mirror], even[:n_mirror], out=south)
+        return out
+
+    def to_grid(self, name, coefficients):
+        """
+        sum_l op(theta, l) coefficients[l] for the table `name`, of shape (n_grid, ...) for coefficients (L, ...),
+        a single product whatever the trailing dimensions.
+        The parts with all-zero coefficients, e.g. for fields of a single parity, are skipped.
+        """
+        coefficients = np.asarray(coefficients)
+        shape = coefficients.shape[1:]
+        coefficients = coefficients.reshape(coefficients.shape[0], -1)
+        parts = []
+        for parity, mask in [('even', self._even), ('odd', ~self._even)]:
+            c = coefficients[mask]
+            table = self._parts[name, parity]
+            if not np.any(c):
+                part = np.zeros((self.n_half, c.shape[1]), dtype=c.dtype)
+            elif np.iscomplexobj(c):
+                # real table times complex coefficients, without casting the table to complex
+                part = (table @ c.view(np.float64)).view(c.dtype)
+            else:
+                part = table @ c
+            parts.append(part.reshape((self.n_half,) + shape))
+        return self._fold(name, *parts)
 
 
 if __name__ == "__main__":
@@ -1,18 +1,30 @@
 from dataclasses import dataclass, field
 from abc import ABC, abstractmethod
-from typing import List
-import matplotlib.pyplot as plt
+from typing import List, Tuple
 import scipy.sparse as scsp
 
 from operators import WorlandTransform
 from operators.polynomials import SphericalHarmonicMode
 from utils import Timer
+from ordering import vector_parity_idx
 import quicc.geometry.spherical.sphere_worland as geo
 import operators.quicc_supplements.sphere_worland as supp_geo
 import quicc.geometry.spherical.sphere_radius_boundary_worland as wbc
 from quicc.geometry.spherical.sphere_boundary_worland import no_bc
 
 
+def curl_parity(parity: Tuple, row_comp: str, col_comp: str):
+    """
+    (l+m) % 2 of the (row_comp, col_comp) block for an operator between the vector parity classes
+    parity = (row, col), each 'DP' (even toroidal, odd poloidal l+m), 'QP' or None for all l
+    """
+    if parity is None or parity == (None, None):
+        return None
+    shift = {'tor': 0, 'pol': 1}
+    return tuple(None if p is None else ({'DP': 0, 'QP': 1}[p] + shift[comp]) % 2
+                 for p, comp in zip(parity, (row_comp, col_comp)))
+
+
 @dataclass
 class _BaseEquation(ABC):
     """
@@ -39,6 +51,21 @@ class _BaseEquation(ABC):
             if attr.startswith('_create'):
                 getattr(self, attr)()
 
+    def restrict(self, op, parity: Tuple = None, ngalerkin: Tuple = (0, 0)):
+        """
+        Rows and columns of a [tor, pol] operator in the vector parity classes parity = (row, col),
+        'DP', 'QP' or None for all. ngalerkin gives the number of radial modes removed per l on each side.
+        """
+        if parity is None:
+            return op
+        nr, maxnl, m = self.res
+        row, col = parity
+        if row is not None:
+            op = scsp.csr_matrix(op)[vector_parity_idx(nr, maxnl, m, row, ngalerkin=ngalerkin[0]), :]
+        if col is not None:
+            op = scsp.csc_matrix(op)[:, vector_parity_idx(nr, maxnl, m, col, ngalerkin=ngalerkin[1])]
+        return op
+
 
 @dataclass
 class InductionEquation(_BaseEquation):
@@ -96,7 +123,8 @@ class InductionEquation(_BaseEquation):
                   transform: WorlandTransform,
                   beta_modes: List[SphericalHarmonicMode],
                   imposed_flow: bool,
-                  quasi_inverse: bool):
+                  quasi_inverse: bool,
+                  parity: Tuple = None):
         """
         Induction term curl (u x B_0), in which B_0 is the background field.
                 [ r.curl2(t_a x B_0), r.curl2(s_a x B_0)
@@ -113,27 +141,36 @@ class InductionEquation(_BaseEquation):
 
         quasi_inverse: whether to apply quasi-inverse operator to the induction.
 
+        parity: vector parity classes (row, col) to assemble, see restrict. Default is None, the full operator.
+
         """
         nr, maxnl, m = self.res
+        ng = int(self.galerkin)
         if len(beta_modes) > 0:
-            tt = sum([transform.curl2tt(mode) + transform.curl2ts(mode) for mode in beta_modes])
-            ts = sum([transform.curl2st(mode) + transform.curl2ss(mode) for mode in beta_modes])
-            st = sum([transform.curl1tt(mode) + transform.curl1ts(mode) for mode in beta_modes])
-            ss = sum([transform.curl1st(mode) + transform.curl1ss(mode) for mode in beta_modes])
+            tt = transform.curl2tt(beta_modes, curl_parity(parity, 'tor', 'tor')) + \
+                transform.curl2ts(beta_modes, curl_parity(parity, 'tor', 'tor'))
+            ts = transform.curl2st(beta_modes, curl_parity(parity, 'tor', 'pol')) + \
+                transform.curl2ss(beta_modes, curl_parity(parity, 'tor', 'pol'))
+            st = transform.curl1tt(beta_modes, curl_parity(parity, 'pol', 'tor')) + \
+                transform.curl1ts(beta_modes, curl_parity(parity, 'pol', 'tor'))
+            ss = transform.curl1st(beta_modes, curl_parity(parity, 'pol', 'pol')) + \
+                transform.curl1ss(beta_modes, curl_parity(parity, 'pol', 'pol'))
             sign = -1.0 if imposed_flow else 1.0
             op = sign * scsp.bmat([[tt, ts], [st, ss]], format='csc')
+            row, col = (None, None) if parity is None else parity
             if quasi_inverse:
-                op = self.quasi_inverse @ op
+                op = self.restrict(self.quasi_inverse, (row, row), (ng, 0)) @ op
             # apply stencil operator for galerkin basis if the flow is imposed,
             # no need to apply stencil if B is imposed in the MC problem
             if self.galerkin and imposed_flow:
-                op = op @ self.stencil
+                op = op @ self.restrict(self.stencil, (col, col), (0, 1))
             return op
         else:
             if self.galerkin:
-                return scsp.csc_matrix((2*(nr-1)*(maxnl-m), 2*(nr-1)*(maxnl-m)))
+                op = scsp.csc_matrix((2*(nr-1)*(maxnl-m), 2*(nr-1)*(maxnl-m)))
             else:
-                return scsp.csc_matrix((2*nr*(maxnl-m), 2*nr*(maxnl-m)))
+                op = scsp.csc_matrix((2*nr*(maxnl-m), 2*nr*(maxnl-m)))
+            return self.restrict(op, parity, (ng, ng))
 
     def _construct_stencil(self):
         """
@@ -244,7 +281,8 @@ class MomentumEquation(_BaseEquation):
 
     def lorentz1(self,
                  transform: WorlandTransform,
-                 modes: List[SphericalHarmonicMode]):
+                 modes: List[SphericalHarmonicMode],
+                 parity: Tuple = None):
         """
         Lorentz term (curl B_0) x b, in which B_0 is the background field.
                     [ r.curl1(J0 x b), r.curl1(J0 x b)
@@ -256,21 +294,28 @@ class MomentumEquation(_BaseEquation):
 
         modes: Spherical harmonic modes of B_0
 
+        parity: vector parity classes (row, col) to assemble, see restrict
+
         """
         nr, maxnl, m = self.res
         if len(modes) > 0:
             curl_modes = [mode.curl() for mode in modes]
-            tt = sum([transform.curl1tt(mode) + transform.curl1ts(mode) for mode in curl_modes])
-            ts = sum([transform.curl1st(mode) + transform.curl1ss(mode) for mode in curl_modes])
-            st = sum([transform.curl2tt(mode) + transform.curl2ts(mode) for mode in curl_modes])
-            ss = sum([transform.curl2st(mode) + transform.curl2ss(mode) for mode in curl_modes])
+            tt = transform.curl1tt(curl_modes, curl_parity(parity, 'tor', 'tor')) + \
+                transform.curl1ts(curl_modes, curl_parity(parity, 'tor', 'tor'))
+            ts = transform.curl1st(curl_modes, curl_parity(parity, 'tor', 'pol')) + \
+                transform.curl1ss(curl_modes, curl_parity(parity, 'tor', 'pol'))
+            st = transform.curl2tt(curl_modes, curl_parity(parity, 'pol', 'tor')) + \
+                transform.curl2ts(curl_modes, curl_parity(parity, 'pol', 'tor'))
+            ss = transform.curl2st(curl_modes, curl_parity(parity, 'pol', 'pol')) + \
+                transform.curl2ss(curl_modes, curl_parity(parity, 'pol', 'pol'))
             return -scsp.bmat([[tt, ts], [st, ss]], format='csc')
         else:
-            return scsp.csc_matrix((2*nr*(maxnl-m), 2*nr*(maxnl-m)))
+            return self.restrict(scsp.csc_matrix((2*nr*(maxnl-m), 2*nr*(maxnl-m))), parity)
 
     def lorentz2(self,
                  transform: WorlandTransform,
-                 modes: List[SphericalHarmonicMode]):
+                 modes: List[SphericalHarmonicMode],
+                 parity: Tuple = None):
         """
         Lorentz term (curl b) x B_0, in which B_0 is the background field.
                     [ r.curl1(j x B_0), r.curl1(j x B_0)
@@ -282,21 +327,28 @@ class MomentumEquation(_BaseEquation):
 
         modes: Spherical harmonic modes of B_0
 
+        parity: vector parity classes (row, col) to assemble, see restrict
+
         """
         nr, maxnl, m = self.res
         if len(modes) > 0:
-            tt = sum([transform.curl1curltt(mode) + transform.curl1curlts(mode) for mode in modes])
-            ts = sum([transform.curl1curlst(mode) + transform.curl1curlss(mode) for mode in modes])
-            st = sum([transform.curl2curltt(mode) + transform.curl2curlts(mode) for mode in modes])
-            ss = sum([transform.curl2curlst(mode) + transform.curl2curlss(mode) for mode in modes])
+            tt = transform.curl1curltt(modes, curl_parity(parity, 'tor', 'tor')) + \
+                transform.curl1curlts(modes, curl_parity(parity, 'tor', 'tor'))
+            ts = transform.curl1curlst(modes, curl_parity(parity, 'tor', 'pol')) + \
+                transform.curl1curlss(modes, curl_parity(parity, 'tor', 'pol'))
+            st = transform.curl2curltt(modes, curl_parity(parity, 'pol', 'tor')) + \
+                transform.curl2curlts(modes, curl_parity(parity, 'pol', 'tor'))
+            ss = transform.curl2curlst(modes, curl_parity(parity, 'pol', 'pol')) + \
+                transform.curl2curlss(modes, curl_parity(parity, 'pol', 'pol'))
             return scsp.bmat([[tt, ts], [st, ss]], format='csc')
         else:
-            return scsp.csc_matrix((2*nr*(maxnl-m), 2*nr*(maxnl-m)))
+            return self.restrict(scsp.csc_matrix((2*nr*(maxnl-m), 2*nr*(maxnl-m))), parity)
 
     def lorentz(self,
                 transform: WorlandTransform,
                 field_modes: List[SphericalHarmonicMode],
-                quasi_inverse=True):
+                quasi_inverse=True,
+                parity: Tuple = None):
         """
         The total linearised Lorentz term (curl B_0) x b + (curl b) x B_0
 
@@ -308,16 +360,20 @@ class MomentumEquation(_BaseEquation):
 
         quasi_inverse: Whether to apply quasi-inverse operator to the matrix
 
+        parity: vector parity classes (row, col) to assemble, see restrict
+
         """
-        op = self.lorentz1(transform, field_modes) + self.lorentz2(transform, field_modes)
+        op = self.lorentz1(transform, field_modes, parity) + self.lorentz2(transform, field_modes, parity)
         if quasi_inverse:
-            op = self.quasi_inverse @ op
+            row = None if parity is None else parity[0]
+            op = self.restrict(self.quasi_inverse, (row, row)) @ op
         return op.tocsc()
 
     def advection(self,
                   transform: WorlandTransform,
                   flow_modes: List[SphericalHarmonicMode],
-                  quasi_inverse=True):
+                  quasi_inverse=True,
+                  parity: Tuple = None):
         """
         The total linearised advection term (curl U_0) x u + (curl u) x U_0
 
@@ -329,8 +385,10 @@ class MomentumEquation(_BaseEquation):
 
         quasi_inverse: Whether to apply quasi-inverse operator to the matrix
 
+        parity: vector parity classes (row, col) to assemble, see restrict
+
         """
-        return self.lorentz(transform, flow_modes, quasi_inverse).tocsc()
+        return self.lorentz(transform, flow_modes, quasi_inverse, parity).tocsc()
 
     def _create_mass(self):
         nr, maxnl, m = self.res
@@ -392,6 +450,7 @@ class MomentumEquation(_BaseEquation):
 
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
     nr, maxnl, m = 11, 11, 1
     n_grid = 120
     with Timer("init op"):
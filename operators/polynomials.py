@@ -1,15 +1,22 @@
 import numpy as np
 import scipy.sparse as scsp
-from sympy.abc import r
-from sympy import lambdify, simplify, diff
-from sympy.parsing.mathematica import mathematica
 from scipy import special
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from numba import njit
 
 import quicc.geometry.worland.worland_basis as wb
 from operators.worland_recurrence import *
 
 
+@lru_cache(maxsize=None)
+def _sym():
+    """ sympy symbol r and the functions used on radial expressions, imported on first use only """
+    from sympy.abc import r
+    from sympy import lambdify, simplify, diff
+    return r, lambdify, simplify, diff
+
+
 def worland_grid(nr):
     return np.cos(np.pi/2*(np.arange(nr-1,-1,-1)+0.5)/nr)
 
@@ -143,74 +150,186 @@ def energy_weight_pol(l, n):
     return l**2 * (l+1)**2 * (poly @ wmat @ poly.T) + l*(l+1)*(diffr @ wmat @ diffr.T)
 
 
+def energy_weights(nr, ls, component):
+    """
+    energy_weight_tor / energy_weight_pol (l, nr-1) for all l in ls as a (L, nr, nr) array, integrated on a single
+    quadrature grid, exact for the largest l and hence for all of them
+    """
+    ls = np.asarray(ls, dtype=np.int64).reshape(-1)
+    rdegree = ls.max() + 2 * (nr - 1)
+    grids, weights = energy_quadrature(rdegree + 2 + (rdegree + 2) % 2)
+    lfac = (ls * (ls + 1.)).reshape(-1, 1, 1)
+    if component == 'tor':
+        poly = worland_operators(nr, ls, grids, ['W'])['W']
+        return lfac * np.matmul(poly.transpose(0, 2, 1) * (grids**2 * weights), poly)
+    elif component == 'pol':
+        ops = worland_operators(nr, ls, grids, ['W', 'divrdiffrW'])
+        poly, diffr = ops['W'], grids.reshape(-1, 1) * ops['divrdiffrW']
+        return lfac**2 * np.matmul(poly.transpose(0, 2, 1) * weights, poly) + \
+            lfac * np.matmul(diffr.transpose(0, 2, 1) * weights, diffr)
+    else:
+        raise RuntimeError(f"Unknown component {component}, must be either 'pol' or 'tor'.")
+
+
+@lru_cache(maxsize=64)
+def energy_blocks(nr, maxnl, m, component):
+    """
+    (L, nr, nr) energy weights of a single-m component, such that the energy of the l block of a spectrum c is
+    factor * Re(c_l^H M_l c_l), with factor = 1 for m = 0 and 2 otherwise. Cached, and read-only.
+    """
+    blocks = energy_weights(nr, np.arange(m, maxnl), component)
+    blocks.flags.writeable = False
+    return blocks
+
+
+@lru_cache(maxsize=64)
+def energy_matrix(nr, maxnl, m, component):
+    """ energy_blocks as a block diagonal sparse matrix. Cached, and read-only. """
+    mat = scsp.block_diag(list(energy_blocks(nr, maxnl, m, component)), format='csr')
+    mat.data.flags.writeable = False
+    return mat
+
+
+@lru_cache(maxsize=64)
+def laplacian_matrix(nr, maxnl, m):
+    """
+    Spectral l-Laplacian of a single-m scalar ordered by l then n, block diagonal with the blocks W_l^T w Lap_l W_l
+    projected on the Worland quadrature. Lap_l W_n^l only involves W_k^l with k < n, the blocks are strictly upper
+    triangular and the round-off below the diagonal is dropped. Cached, and read-only.
+    """
+    n_grid = nr + maxnl // 2 + 10
+    rg, weight = worland_grid(n_grid), worland_weight(n_grid)
+    ops = worland_operators(nr, np.arange(m, maxnl), rg, ['W', 'laplacianlW'])
+    blocks = np.triu(np.matmul(ops['W'].transpose(0, 2, 1) * weight, ops['laplacianlW']), 1)
+    mat = scsp.block_diag(list(blocks), format='csr')
+    mat.data.flags.writeable = False
+    return mat
+
+
+@lru_cache(maxsize=64)
+def curl_matrix(nr, maxnl, m):
+    """
+    Spectral curl of a single-m vector field, toroidal then poloidal coefficients: the curl of T r is T as poloidal
+    coefficients, the curl of the poloidal field of P is the toroidal field of -Lap_l P. Cached, and read-only.
+    """
+    dim = nr * (maxnl - m)
+    mat = scsp.bmat([[None, -laplacian_matrix(nr, maxnl, m)], [scsp.identity(dim), None]], format='csr')
+    mat.data.flags.writeable = False
+    return mat
+
+
 class SymOperatorBase(ABC):
     def __init__(self, *args, **kwargs):
         super().__init__()
         pass
 
     @abstractmethod
-    def apply(self, expr, r_grid):
+    def derive(self, expr):
+        """ symbolic result of the operator acting on expr """
         pass
 
+    @abstractmethod
+    def radial_terms(self, l):
+        """
+        the operator acting on f = r^l g(2r^2-1), as a list of terms (c, p, k) meaning c r^(l+p) d^k g / dx^k
+        """
+        pass
+
+    @property
+    def key(self):
+        """ identifies the operator, operators with the same key give the same result """
+        return type(self).__name__,
+
+    def __eq__(self, other):
+        return isinstance(other, SymOperatorBase) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def compile(self, expr):
+        """ numpy function of the simplified result, derived once per (operator, expr) """
+        return _compile_sym_operator(self, expr)
+
+    def apply(self, expr, r_grid):
+        return self.compile(expr)(r_grid)
+
+
+@lru_cache(maxsize=None)
+def _compile_sym_operator(operator: SymOperatorBase, expr):
+    r, lambdify, simplify, _ = _sym()
+    return lambdify(r, simplify(operator.derive(expr)), "numpy")
+
 
 class SymDivr(SymOperatorBase):
     def __init__(self):
         super(SymDivr, self).__init__()
 
-    def apply(self, expr, r_grid):
-        divrf = simplify(expr / r)
-        func = lambdify(r, divrf, "numpy")
-        return func(r_grid)
+    def derive(self, expr):
+        r = _sym()[0]
+        return expr / r
+
+    def radial_terms(self, l):
+        return [(1, -1, 0)]
 
 
 class SymDivr2(SymOperatorBase):
     def __init__(self):
         super(SymDivr2, self).__init__()
 
-    def apply(self, expr, r_grid):
-        divr2f = simplify(expr / r / r)
-        func = lambdify(r, divr2f, "numpy")
-        return func(r_grid)
+    def derive(self, expr):
+        r = _sym()[0]
+        return expr / r / r
+
+    def radial_terms(self, l):
+        return [(1, -2, 0)]
 
 
 class SymDivrDiffr(SymOperatorBase):
     def __init__(self):
         super(SymDivrDiffr, self).__init__()
 
-    def apply(self, expr, r_grid):
-        divrdiffrf = simplify(diff(r * expr, r) / r)
-        func = lambdify(r, divrdiffrf, "numpy")
-        return func(r_grid)
+    def derive(self, expr):
+        r, _, _, diff = _sym()
+        return diff(r * expr, r) / r
+
+    def radial_terms(self, l):
+        return [(l+1, -1, 0), (4, 1, 1)]
 
 
 class SymDiff(SymOperatorBase):
     def __init__(self):
         super(SymDiff, self).__init__()
 
-    def apply(self, expr, r_grid):
-        difff = simplify(diff(expr, r))
-        func = lambdify(r, difff, "numpy")
-        return func(r_grid)
+    def derive(self, expr):
+        r, _, _, diff = _sym()
+        return diff(expr, r)
+
+    def radial_terms(self, l):
+        return [(l, -1, 0), (4, 1, 1)]
 
 
 class SymDiffDivr(SymOperatorBase):
     def __init__(self):
         super(SymDiffDivr, self).__init__()
 
-    def apply(self, expr, r_grid):
-        diffdivrf = simplify(diff(expr / r, r))
-        func = lambdify(r, diffdivrf, "numpy")
-        return func(r_grid)
+    def derive(self, expr):
+        r, _, _, diff = _sym()
+        return diff(expr / r, r)
+
+    def radial_terms(self, l):
+        return [(l-1, -2, 0), (4, 0, 1)]
 
 
 class SymDivr2Diffr(SymOperatorBase):
     def __init__(self):
         super(SymDivr2Diffr, self).__init__()
 
-    def apply(self, expr, r_grid):
-        divrdiffrf = simplify(diff(r * expr, r) / r ** 2)
-        func = lambdify(r, divrdiffrf, "numpy")
-        return func(r_grid)
+    def derive(self, expr):
+        r, _, _, diff = _sym()
+        return diff(r * expr, r) / r ** 2
+
+    def radial_terms(self, l):
+        return [(l+1, -2, 0), (4, 0, 1)]
 
 
 class SymLaplacianl(SymOperatorBase):
@@ -218,21 +337,29 @@ class SymLaplacianl(SymOperatorBase):
         super(SymLaplacianl, self).__init__()
         self.l = l
 
-    def apply(self, expr, r_grid):
+    @property
+    def key(self):
+        return type(self).__name__, self.l
+
+    def derive(self, expr):
+        r, _, _, diff = _sym()
         l = self.l
-        laplacianlf = simplify(diff(r ** 2 * diff(expr, r), r) / r ** 2 - l * (l + 1) / r ** 2 * expr)
-        func = lambdify(r, laplacianlf, "numpy")
-        return func(r_grid)
+        return diff(r ** 2 * diff(expr, r), r) / r ** 2 - l * (l + 1) / r ** 2 * expr
+
+    def radial_terms(self, l):
+        return [(l*(l+1) - self.l*(self.l+1), -2, 0), (8*l+12, 0, 1), (16, 2, 2)]
 
 
 class SymrDiffDivr2Diffr(SymOperatorBase):
     def __init__(self):
         super(SymrDiffDivr2Diffr, self).__init__()
 
-    def apply(self, expr, r_grid):
-        opf = simplify(r*diff(diff(r*expr, r)/r**2, r))
-        func = lambdify(r, opf, "numpy")
-        return func(r_grid)
+    def derive(self, expr):
+        r, _, _, diff = _sym()
+        return r*diff(diff(r*expr, r)/r**2, r)
+
+    def radial_terms(self, l):
+        return [(l*(l-1)-2, -2, 0), (4*(2*l+1), 0, 1), (16, 2, 2)]
 
 
 def alpha(l, m):
@@ -243,72 +370,151 @@ def lgClm(l, m):
     return 0.5 * (special.loggamma(l - m + 1) - special.loggamma(l + m + 1) + np.log((2. * l + 1.) / 4. / np.pi))
 
 
-def Plm(m, lmax, theta):
+def _sectoral(m):
+    """ C_m^m (-1)^m (2m-1)!!, accumulated as a product so that it neither overflows nor depends on factorial2(-1) """
+    return np.prod(-np.sqrt((2. * np.arange(1, m + 1) + 1.) / (2. * np.arange(1, m + 1)))) / np.sqrt(4. * np.pi)
+
+
+@njit(cache=True)
+def _alpha(m, n):
+    """ alpha(l, m) for l = m, ..., m+n-1 """
+    a = np.zeros(n)
+    for i in range(1, n):
+        l = m + i
+        a[i] = np.sqrt((l - m) * (l + m) / ((2. * l - 1.) * (2. * l + 1.)))
+    return a
+
+
+@njit(cache=True)
+def _tesseral(out, m, x):
+    """ fill out[:, l-m] for l > m in place by the three-term recurrence in l, out[:, 0] holding the seed at l = m """
+    a = _alpha(m, out.shape[1])
+    for j in range(x.shape[0]):
+        prev, cur = 0., out[j, 0]
+        for i in range(1, out.shape[1]):
+            prev, cur = cur, (x[j] * cur - a[i - 1] * prev) / a[i]
+            out[j, i] = cur
+
+
+@njit(cache=True)
+def _dtheta_from_divsin(out, m, pds):
+    """ D_theta C_l^m P_l^m = l alpha(l+1, m) P_{l+1}^m / sin - (l+1) alpha(l, m) P_{l-1}^m / sin, for m > 0 """
+    a = _alpha(m, out.shape[1] + 1)
+    for j in range(out.shape[0]):
+        for i in range(out.shape[1]):
+            l = m + i
+            out[j, i] = l * a[i + 1] * pds[j, i + 1]
+            if i > 0:
+                out[j, i] -= (l + 1.) * a[i] * pds[j, i - 1]
+
+
+def _fill_legendre(out, m, theta, power):
+    """ C_l^m P_l^m(cos theta) / sin^(m-power) theta for l = m, ..., written into out """
+    out[:, 0] = _sectoral(m) * np.sin(theta) ** power
+    _tesseral(out, m, np.cos(theta))
+    return out
+
+
+def Plm(m, lmax, theta, out=None):
     """ compute spherical harmonics (excluding the e^{im\phi} term), evaluated on theta grid  """
-    cos_theta = np.cos(theta).reshape(-1, 1)
-
-    if lmax == m:
-        C = np.exp(-0.5 * special.loggamma(2 * m + 1)) * np.sqrt((2. * m + 1.) / (4. * np.pi))
-        val = C * (-1.) ** m * special.factorial2(2 * m - 1) * (1. - np.cos(theta) ** 2) ** (m / 2.)
-        return val.reshape(-1, 1)
-    elif lmax > m:
-        vals = []
-        C = np.exp(-0.5 * special.loggamma(2 * m + 1)) * np.sqrt((2. * m + 1.) / (4. * np.pi))
-        tmp = C * (-1.) ** m * special.factorial2(2 * m - 1) * (1. - np.cos(theta) ** 2) ** (m / 2.)
-        vals.append(tmp.reshape(-1, 1))
-        for l in range(m, lmax):
-            if l > m:
-                tmp = (cos_theta * vals[l - m] - alpha(l, m) * vals[l - m - 1]) / alpha(l + 1, m)
-            else:
-                tmp = cos_theta * vals[l - m] / alpha(l + 1, m)
-            vals.append(tmp)
-        return np.concatenate(vals, axis=1)
+    theta = np.asarray(theta, dtype=np.float64).reshape(-1)
+    if out is None:
+        out = np.empty((theta.shape[0], lmax - m + 1))
+    return _fill_legendre(out, m, theta, m)
 
 
-def PlmDivSin(m, lmax, theta):
+def PlmDivSin(m, lmax, theta, out=None):
     """ compute value of C_l^m P_l^m(\cos\theta) / \sin\theta, on theta, for a single m
-    Only for m > 0 !"""
+    Only for m > 0 !
+    Same recurrence as Plm, seeded with sin^(m-1), so that no division by sin is needed at the poles """
+    theta = np.asarray(theta, dtype=np.float64).reshape(-1)
+    if out is None:
+        out = np.empty((theta.shape[0], lmax - m + 1))
     if m > 0:
-        plm_m1 = Plm(m - 1, lmax, theta)
-        plm_p1 = Plm(m + 1, lmax, theta)
-
-        val = []
-        for l in range(m, lmax + 1):
-            if l - 1 >= m + 1:
-                tmp = -1. / (2. * m) * np.exp(lgClm(l, m) - lgClm(l - 1, m + 1)) * plm_p1[:, l - m - 2] \
-                      - (l + m - 1.) * (l + m) / (2. * m) * np.exp(lgClm(l, m) - lgClm(l - 1, m - 1)) * plm_m1[:, l - m]
-            else:
-                tmp = - (l + m - 1.) * (l + m) / (2. * m) * np.exp(lgClm(l, m) - lgClm(l - 1, m - 1)) * plm_m1[:, l - m]
-            val.append(tmp.reshape(-1, 1))
-        return np.concatenate(val, axis=1)
-    else:
-        return np.zeros((theta.shape[0], lmax-m+1))
+        return _fill_legendre(out, m, theta, m - 1)
+    out[...] = 0.
+    return out
 
 
-def DthetaPlm(m, lmax, Plm, PlmDivSin, theta):
+def DthetaPlm(m, lmax, Plm, PlmDivSin, theta, out=None):
     """ compute value of D_theta C_l^m P_l^m(\cos\theta), for a single m
-    m = 0 compute in a different way """
-
-    sin_theta = np.sin(theta).reshape(-1, 1)
-    # m=0
+    PlmDivSin has to be given up to lmax + 1.
+    m = 0 uses D_theta C_l^0 P_l^0 = sqrt(l(l+1)) C_l^1 P_l^1 instead, Plm and PlmDivSin are then not used """
+    theta = np.asarray(theta, dtype=np.float64).reshape(-1)
+    if out is None:
+        out = np.empty((theta.shape[0], lmax - m + 1))
     if m == 0:
-        val = [np.zeros(sin_theta.shape), -0.5 * np.sqrt(3. / np.pi) * sin_theta]
-        for l in range(1, lmax):
-            tmp = np.exp(lgClm(l + 1, 0) - lgClm(l - 1, 0)) * val[l - 1] - \
-                  (2. * l + 1.) * np.exp(lgClm(l + 1, 0) - lgClm(l, 0)) * sin_theta * Plm[:, l].reshape(-1, 1)
-            val.append(tmp.reshape(-1, 1))
-        DthetaPlm = np.concatenate(val, axis=1)
-    # m>0
+        out[:, 0] = 0.
+        if lmax > 0:
+            ls = np.arange(1, lmax + 1)
+            _fill_legendre(out[:, 1:], 1, theta, 1)
+            out[:, 1:] *= np.sqrt(ls * (ls + 1.))
     else:
-        val = []
-        for l in range(m, lmax + 1):
-            if l > m:
-                tmp = -(l + 1.) * alpha(l, m) * PlmDivSin[:, l - m - 1] + l * alpha(l + 1, m) * PlmDivSin[:, l + 1 - m]
-            else:
-                tmp = l * alpha(l + 1, m) * PlmDivSin[:, l + 1 - m]
-            val.append(tmp.reshape(-1, 1))
-        DthetaPlm = np.concatenate(val, axis=1)
-    return DthetaPlm
+        _dtheta_from_divsin(out, m, PlmDivSin)
+    return out
+
+
+def legendre_tables(m, lmax, theta):
+    """
+    Plm, PlmDivSin and DthetaPlm for l = m, ..., lmax, as (n_theta, lmax-m+1) arrays, from a single table fill:
+    P_l^m / sin is computed up to lmax + 1, P_l^m = sin P_l^m / sin and D_theta P_l^m follow from it
+    """
+    theta = np.asarray(theta, dtype=np.float64).reshape(-1)
+    if m == 0:
+        plm = Plm(0, lmax, theta)
+        return plm, np.zeros_like(plm), DthetaPlm(0, lmax, None, None, theta)
+    pds = PlmDivSin(m, lmax + 1, theta)
+    plm = np.sin(theta).reshape(-1, 1) * pds[:, :-1]
+    return plm, np.ascontiguousarray(pds[:, :-1]), DthetaPlm(m, lmax, None, pds, theta)
+
+
+@njit(cache=True)
+def _legendre_all_m(plm, pds, dplm, x, s):
+    """
+    fill the (M+1, n_theta, lmax+1) tables for all m, with l as the last index (zero for l < m).
+    The sectoral values follow P_m^m / sin = -sqrt((2m+1)/2m) P_{m-1}^{m-1}, then the recurrence in l for each m.
+    """
+    mmax, lmax = plm.shape[0] - 1, plm.shape[2] - 1
+    sectoral = np.full(x.shape[0], 1. / np.sqrt(4. * np.pi))
+    col = np.empty((x.shape[0], lmax + 2))
+    for m in range(max(mmax, 1) + 1):
+        if m == 0:
+            col[:, 0] = sectoral
+        else:
+            col[:, 0] = -np.sqrt((2. * m + 1.) / (2. * m)) * sectoral
+            sectoral = s * col[:, 0]
+        n = lmax + 2 - m
+        if n <= 0:
+            break
+        _tesseral(col[:, :n], m, x)
+        if m == 0:
+            plm[0, :, :] = col[:, :lmax + 1]
+            continue
+        if m <= mmax:
+            for j in range(x.shape[0]):
+                for i in range(min(n, lmax + 1 - m)):
+                    pds[m, j, m + i] = col[j, i]
+                    plm[m, j, m + i] = s[j] * col[j, i]
+            if n > 1:
+                _dtheta_from_divsin(dplm[m, :, m:], m, col[:, :n])
+        if m == 1:
+            # D_theta C_l^0 P_l^0 = sqrt(l(l+1)) C_l^1 P_l^1
+            for j in range(x.shape[0]):
+                for l in range(1, lmax + 1):
+                    dplm[0, j, l] = np.sqrt(l * (l + 1.)) * s[j] * col[j, l - 1]
+
+
+def legendre_tables_all_m(mmax, lmax, theta):
+    """
+    Plm, PlmDivSin and DthetaPlm for all m = 0, ..., mmax and l = 0, ..., lmax at once, as (mmax+1, n_theta, lmax+1)
+    arrays indexed by absolute l, the entries with l < m being zero.
+    The sectoral recurrence is run once along m, followed by the tesseral recurrence in l for each m.
+    """
+    theta = np.asarray(theta, dtype=np.float64).reshape(-1)
+    shape = (mmax + 1, theta.shape[0], lmax + 1)
+    plm, pds, dplm = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    _legendre_all_m(plm, pds, dplm, np.cos(theta), np.sin(theta))
+    return plm, pds, dplm
 
 
 class SphericalHarmonicMode:
@@ -320,20 +526,112 @@ class SphericalHarmonicMode:
         self.comp = comp
         self.l = l
         self.m = m
+        r, lambdify, _, _ = _sym()
         if isinstance(radial_func, str):
+            from sympy.parsing.mathematica import mathematica
             self.radial_expr = mathematica(radial_func)
             self.radial_func = lambdify(r, self.radial_expr, "numpy")
         else:
             self.radial_expr = radial_func
             self.radial_func = lambdify(r, self.radial_expr, "numpy")
+        self._curl = None
+        self._profiles = {}
+
+    @property
+    def key(self):
+        """ identity of the mode, equal for modes with the same component, degree, order and radial function """
+        return 'sym', self.comp, self.l, self.m, self.radial_expr
+
+    def radial_profile(self, operator: SymOperatorBase, r_grid: np.ndarray):
+        """
+        operator applied to the radial function, evaluated on r_grid. Cached per (operator, grid),
+        so sympy is only touched the first time a profile is needed on a grid.
+        """
+        key = (operator.key, r_grid.shape, hash(r_grid.tobytes()))
+        if key not in self._profiles:
+            profile = np.ones(r_grid.shape) * operator.apply(self.radial_expr, r_grid)
+            profile.flags.writeable = False
+            self._profiles[key] = profile
+        return self._profiles[key]
 
     def curl(self):
-        if self.comp == "tor":
-            return SphericalHarmonicMode("pol", self.l, self.m, radial_func=self.radial_expr)
-        else:
-            l = self.l
-            expr = simplify(diff(r**2*diff(self.radial_expr, r), r)/r**2 - l*(l+1)/r**2*self.radial_expr)
-            return SphericalHarmonicMode("tor", self.l, self.m, radial_func=-expr)
+        if self._curl is None:
+            if self.comp == "tor":
+                self._curl = SphericalHarmonicMode("pol", self.l, self.m, radial_func=self.radial_expr)
+            else:
+                l = self.l
+                r, _, simplify, diff = _sym()
+                expr = simplify(diff(r**2*diff(self.radial_expr, r), r)/r**2 - l*(l+1)/r**2*self.radial_expr)
+                self._curl = SphericalHarmonicMode("tor", self.l, self.m, radial_func=-expr)
+        return self._curl
+
+
+class NumericalSphericalHarmonicMode:
+    """
+    Spherical harmonic mode of toroidal/poloidal field, whose radial function is given numerically by
+    its Worland coefficients, f(r) = sum_n c_n W_n^l(r). No sympy is involved: all radial operators
+    are evaluated exactly from the Jacobi series and its derivatives.
+    """
+    def __init__(self, comp, l, m, coefficients: np.ndarray):
+        assert comp in ['tor', 'pol']
+        self.comp = comp
+        self.l = l
+        self.m = m
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.nr = self.coefficients.shape[0]
+        self._curl = None
+        self._profiles = {}
+
+    @property
+    def key(self):
+        """ identity of the mode, equal for modes with the same component, degree, order and coefficients """
+        return 'num', self.comp, self.l, self.m, self.coefficients.tobytes()
+
+    @classmethod
+    def from_grid(cls, comp, l, m, values: np.ndarray, nr: int):
+        """
+        Construction from values of the radial function on worland_grid(values.shape[0]), projected onto nr modes
+        """
+        n_grid = values.shape[0]
+        rg = worland_grid(n_grid)
+        coefficients = worland(nr, l, rg).T @ (worland_weight(n_grid) * values)
+        return cls(comp, l, m, coefficients)
+
+    def _jacobi_series(self, k, x):
+        """ k-th derivative of g(x) = sum_n c_n norm_n P_n(x) """
+        nr, l = self.nr, self.l
+        a, b = -0.5, l - 0.5
+        coe = np.array([wb.worland_norm(n, l) for n in range(nr)]) * self.coefficients
+        poly = [jacobiP, DjacobiP, D2jacobiP][k](nr, a, b, x, np.ones_like(x))
+        return poly @ coe
+
+    def radial_profile(self, operator: SymOperatorBase, r_grid: np.ndarray):
+        """
+        operator applied to the radial function, evaluated on r_grid, cached per (operator, grid)
+        """
+        key = (operator.key, r_grid.shape, hash(r_grid.tobytes()))
+        if key not in self._profiles:
+            x = 2.0 * r_grid ** 2 - 1.0
+            profile = np.zeros(r_grid.shape)
+            for c, p, k in operator.radial_terms(self.l):
+                if c != 0:
+                    profile += c * r_grid ** float(self.l + p) * self._jacobi_series(k, x)
+            profile.flags.writeable = False
+            self._profiles[key] = profile
+        return self._profiles[key]
+
+    def curl(self):
+        if self._curl is None:
+            if self.comp == "tor":
+                self._curl = NumericalSphericalHarmonicMode("pol", self.l, self.m, self.coefficients)
+            else:
+                # -Laplacian_l f projected back by a quadrature that is exact for the polynomial integrand
+                nr, l = self.nr, self.l
+                n_grid = nr + l // 2 + 10
+                rg = worland_grid(n_grid)
+                coefficients = -worland(nr, l, rg).T @ (worland_weight(n_grid) * (laplacianlW(nr, l, rg) @ self.coefficients))
+                self._curl = NumericalSphericalHarmonicMode("tor", self.l, self.m, coefficients)
+        return self._curl
 
 
 if __name__ == "__main__":
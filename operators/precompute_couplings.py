@@ -0,0 +1,25 @@
+""" Fill the on-disk store of Gaunt/Elsasser coupling tables, e.g.
+        python -m operators.precompute_couplings --maxnl 81 --m 0 10 --lb 1 2 3
+    The store is MCMODES_COUPLING_STORE, or ~/.cache/mcmodes/couplings if it is not set.
+"""
+import argparse
+
+from operators.threeJ_integrals import precompute, coupling_store, set_coupling_store, default_coupling_store
+from utils import Timer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--maxnl', type=int, required=True, help="largest maxnl (L + 1) of the sweep")
+    parser.add_argument('--m', type=int, nargs=2, default=(0, 0), metavar=('M_MIN', 'M_MAX'),
+                        help="range of azimuthal wave numbers, inclusive")
+    parser.add_argument('--lb', type=int, nargs='+', default=[1, 2], help="degrees of the background modes")
+    parser.add_argument('--store', type=str, default=None, help="store directory, overriding MCMODES_COUPLING_STORE")
+    args = parser.parse_args()
+
+    if args.store is not None:
+        set_coupling_store(args.store)
+    elif coupling_store() is None:
+        set_coupling_store(default_coupling_store())
+    with Timer("precompute couplings"):
+        precompute(args.maxnl, range(args.m[0], args.m[1] + 1), args.lb)
@@ -1,16 +1,25 @@
+""" Gaunt and Elsasser coupling integrals of spherical harmonics.
+
+    The coupling tables are cached in memory. An on-disk store of the tables, shared between processes and runs, is
+    opt-in: set the environment variable MCMODES_COUPLING_STORE to its directory, or call set_coupling_store, e.g.
+    with default_coupling_store(). A store that cannot be written is only read from, or ignored.
+"""
+import os
+from functools import lru_cache
 import numpy as np
-from sympy.physics.wigner import gaunt, wigner_3j
 from math import sqrt, pi
 
 from utils import Timer
 
 
 def _gaunt(l_1, l_2, l_3, m_1, m_2, m_3):
+    from sympy.physics.wigner import gaunt
     g = gaunt(l_1, l_2, l_3, m_1, m_2, m_3)
     return g if isinstance(g, int) else (-1)**(m_1+m_2)*float(gaunt(l_1, l_2, l_3, m_1, m_2, m_3).n(17))
 
 
 def _elsasser(l_1, l_2, l_3, m_1, m_2, m_3):
+    from sympy.physics.wigner import wigner_3j
     e = wigner_3j(l_1+1, l_2+1, l_3+1, 0, 0, 0) * wigner_3j(l_1, l_2, l_3, m_1, m_2, m_3)
     if not isinstance(e, int):
         e = float(e.n(17))
@@ -21,48 +30,333 @@ def _elsasser(l_1, l_2, l_3, m_1, m_2, m_3):
     return -1.0j * (-1)**(m_1+m_2) * e
 
 
-def gaunt_matrix(maxnl, m, lb, return_matrix=False):
+# running values are rescaled by _BIG whenever they exceed it, the recursions growing fast outside the classical region
+_BIG = 2.0 ** 300
+
+
+def _wigner_3j_table(la, lb, m, lg_start, n_lg):
+    """
+    Wigner 3j symbols (la lb lg; m 0 -m) for a vector of la, and lg = lg_start, ..., lg_start + n_lg - 1,
+    using the Schulten-Gordon three-term recursion in lg, vectorised over la.
+    The recursion is run forward from lg_min and backward from lg_max, each towards the classical region where
+    it is stable, and the two are matched there (Luscombe and Luban, 1998). The sign is fixed at lg_max.
+    :param la: 1d integer array of l for alpha mode
+    :param lb: l for beta mode
+    :param m: m for alpha mode, -m for gamma mode
+    :param lg_start: smallest lg of the table
+    :param n_lg: number of lg in the table
+    :return: array of shape (n_lg, la.shape[0])
+    """
+    la = np.asarray(la, dtype=np.int64)
+    n_la = la.shape[0]
+    rows = np.arange(n_la)
+    lg_min = np.maximum(np.abs(la - lb), m)
+    lg_max = la + lb
+    n_term = np.maximum(lg_max - lg_min + 1, 0)
+    n_rec = max(int(n_term.max(initial=0)), 1)
+
+    # the recursion is carried out in float, on the padded offsets k = lg - lg_min
+    l2a, l2b = la*(la+1.0), lb*(lb+1.0)
+
+    def a_coe(j):
+        return np.sqrt(np.maximum((j**2 - (la-lb)**2) * ((la+lb+1.0)**2 - j**2) * (j**2 - m**2), 0.))
+
+    def b_coe(j):
+        return (2*j+1.0) * m * (l2a - l2b - j*(j+1.0))
+
+    # matching point: the middle of the classical region, where the characteristic roots of
+    # j A(j+1) x^2 + B(j) x + (j+1) A(j) are complex, or the point closest to it if there is none
+    k = np.arange(n_rec)[None, :]
+    j = lg_min[:, None] + k + 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        q = b_coe(j.T).T**2 / (4 * j * (j+1) * a_coe(j.T).T * a_coe(j.T + 1).T)
+    q = np.where((k >= 1) & (k <= n_term[:, None] - 2) & ~np.isnan(q), q, np.inf)
+    classical = q < 1
+    first = np.argmax(classical, axis=1)
+    last = n_rec - 1 - np.argmax(classical[:, ::-1], axis=1)
+    k_match = np.where(classical.any(axis=1), (first + last) // 2, np.argmin(q, axis=1))
+    k_match = np.minimum(k_match, np.maximum(n_term - 1, 0))
+
+    def store(f, val, k_col, at):
+        """ f[i, k_col[i]] = val[i] for the rows at, rescaling the rows where the values grow too large """
+        big = at & (np.abs(val) > _BIG)
+        f[big] /= _BIG
+        val[big] /= _BIG
+        f[rows[at], k_col[at]] = val[at]
+
+    # forward from lg_min, up to one past the matching point
+    forward = np.zeros((n_la, n_rec))
+    forward[:, 0] = 1.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for kf in range(1, n_rec):
+            jf = lg_min + kf - 1.0
+            if kf == 1:
+                val = -b_coe(jf) * forward[:, 0] / (jf * a_coe(jf+1))
+            else:
+                val = -(b_coe(jf) * forward[:, kf-1] + (jf+1) * a_coe(jf) * forward[:, kf-2]) / (jf * a_coe(jf+1))
+            # lg_min = 0 only happens for m = 0, in which case the odd terms vanish
+            val = np.where(jf > 0, val, 0.)
+            store(forward, val, np.full(n_la, kf), (kf < n_term) & (kf <= k_match + 1))
+
+    # backward from lg_max, down to one before the matching point
+    backward = np.zeros((n_la, n_rec))
+    backward[rows, np.maximum(n_term - 1, 0)] = 1.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for t in range(1, n_rec):
+            k_col = n_term - 1 - t
+            jb = lg_min + k_col + 1.0
+            g1 = backward[rows, np.clip(k_col + 1, 0, n_rec - 1)]
+            g2 = backward[rows, np.clip(k_col + 2, 0, n_rec - 1)] if t > 1 else np.zeros(n_la)
+            val = -(jb * a_coe(jb+1) * g2 + b_coe(jb) * g1) / ((jb+1) * a_coe(jb))
+            store(backward, val, k_col, (k_col >= 0) & (k_col >= k_match - 1))
+
+    # least squares match on the three points around the matching point
+    window = np.clip(k_match[:, None] + np.arange(-1, 2)[None, :], 0, np.maximum(n_term - 1, 0)[:, None])
+    fw, bw = forward[rows[:, None], window], backward[rows[:, None], window]
+    scale = np.sum(fw * bw, axis=1) / np.sum(bw * bw, axis=1)
+    f = np.where(k <= k_match[:, None], forward, scale[:, None] * backward)
+    f /= np.maximum(np.abs(f).max(axis=1, initial=0), np.finfo(float).tiny)[:, None]
+
+    # normalisation sum_lg (2lg+1) 3j^2 = 1, and the sign of the stretched symbol (-1)^(la-lb+m)
+    lg = lg_min[:, None] + np.arange(n_rec)[None, :]
+    valid = np.arange(n_rec)[None, :] < n_term[:, None]
+    f[~valid] = 0.
+    norm = np.sqrt(np.sum((2*lg+1.0) * f**2, axis=1))
+    end = f[rows, np.maximum(n_term-1, 0)]
+    sign = np.where((la - lb + m) % 2 == 0, 1.0, -1.0) * np.sign(end)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f *= np.where(n_term > 0, sign / norm, 0.)[:, None]
+
+    table = np.zeros((n_lg, n_la))
+    row = lg - lg_start
+    mask = valid & (row >= 0) & (row < n_lg)
+    col = np.broadcast_to(rows[:, None], lg.shape)
+    table[row[mask], col[mask]] = f[mask]
+    return table
+
+
+def _gaunt_table(maxnl, m, lb):
+    """ float64 Gaunt coefficients K[lg-m, la-m], for m <= la, lg < maxnl """
+    l = np.arange(m, maxnl)
+    threej_m = _wigner_3j_table(l, lb, m, m, maxnl-m)
+    threej_0 = _wigner_3j_table(l, lb, 0, m, maxnl-m)
+    factor = np.sqrt(np.outer(2*l+1.0, 2*l+1.0) * (2*lb+1) / (4*pi))
+    return (-1)**m * factor * threej_0 * threej_m
+
+
+def _elsasser_table(maxnl, m, lb):
+    """ float64 Elsasser coefficients L[lg-m, la-m], for m <= la, lg < maxnl """
+    l = np.arange(m, maxnl)
+    threej_m = _wigner_3j_table(l, lb, m, m, maxnl-m)
+    threej_0 = _wigner_3j_table(l+1, lb+1, 0, m+1, maxnl-m)
+    lg, la = np.meshgrid(l, l, indexing='ij')
+    lsum = la + lb + lg
+    triangle = np.maximum((la+lb-lg+1) * (la-lb+lg+1) * (-la+lb+lg+1), 0)
+    factor = np.sqrt((2*la+1.0) * (2*lb+1.0) * (2*lg+1.0) / (4*pi))
+    factor *= np.sqrt((lsum+2.0) * (lsum+4.0) / 4 / (lsum+3.0))
+    factor *= np.sqrt(triangle)
+    return -1.0j * (-1)**m * factor * threej_0 * threej_m
+
+
+# on-disk store of coupling tables, one .npy file per (kind, m, lb) holding the largest maxnl computed so far.
+# Bump the version whenever the table layout or the numerics change.
+_STORE_VERSION = 2
+_store_dir = os.environ.get('MCMODES_COUPLING_STORE') or None
+_TABLES = {'gaunt': _gaunt_table, 'elsasser': _elsasser_table}
+
+
+def default_coupling_store():
+    """ the conventional location of the store, in the user's cache directory """
+    return os.path.join(os.path.expanduser('~'), '.cache', 'mcmodes', 'couplings')
+
+
+def coupling_store():
+    """ the directory of the on-disk coupling store, None if disabled """
+    return _store_dir
+
+
+def set_coupling_store(path):
+    """
+    Set the directory of the on-disk coupling store, None disables the store. Clears the in-memory cache.
+    """
+    global _store_dir
+    _store_dir = path
+    coupling_table.cache_clear()
+
+
+def _store_path(kind, m, lb):
+    return os.path.join(_store_dir, f"v{_STORE_VERSION}", f"{kind}_m{m}_lb{lb}.npy")
+
+
+def _load_table(kind, maxnl, m, lb):
+    """ memory-map a stored table, None if it is missing or too small """
+    if _store_dir is None:
+        return None
+    try:
+        table = np.load(_store_path(kind, m, lb), mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if table.shape[0] < maxnl - m:
+        return None
+    return table[:maxnl-m, :maxnl-m]
+
+
+def _stored_size(path):
+    """ number of l of a stored table, 0 if there is none """
+    try:
+        return np.load(path, mmap_mode='r').shape[0]
+    except (OSError, ValueError):
+        return 0
+
+
+def _save_table(kind, m, lb, table):
+    """
+    write atomically, so that concurrent processes never read a partial file, and only over a smaller table,
+    so that a concurrent process storing a larger maxnl is not undone
+    """
+    if _store_dir is None:
+        return
+    path = _store_path(kind, m, lb)
+    if _stored_size(path) >= table.shape[0]:
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            np.save(f, table)
+        if _stored_size(path) >= table.shape[0]:
+            os.remove(tmp)
+        else:
+            os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+@lru_cache(maxsize=256)
+def coupling_table(kind, maxnl, m, lb):
+    """
+    Read-only coupling table [lg-m, la-m] of the given kind ('gaunt' or 'elsasser').
+    Looked up in memory first, then in the on-disk store, and computed (and stored) only if both miss.
+    """
+    table = _load_table(kind, maxnl, m, lb)
+    if table is None:
+        table = _TABLES[kind](maxnl, m, lb)
+        _save_table(kind, m, lb, table)
+        table.flags.writeable = False
+    return table
+
+
+def precompute(maxnl, ms, lbs, kinds=('gaunt', 'elsasser')):
+    """
+    Fill the on-disk store for all l < maxnl. Tables are nested in maxnl, so this covers every lower truncation.
+    Without a store, see set_coupling_store, the tables are only cached in memory.
+    """
+    for kind in kinds:
+        for m in ms:
+            for lb in lbs:
+                if m < maxnl:
+                    coupling_table(kind, maxnl, m, lb)
+
+
+def _coupling(kind, maxnl, m, lb):
+    """
+    Nonzero couplings allowed by the selection rules |la - lg| <= lb and
+    la + lb + lg even (Gaunt) or odd (Elsasser), as arrays (lg, la, value) sorted by lg then la
+    """
+    parity = {'gaunt': 0, 'elsasser': 1}[kind]
+    offsets = np.array([d for d in range(-lb, lb+1) if (lb + d) % 2 == parity], dtype=np.int64)
+    la = np.arange(m, maxnl)
+    lg = la[:, None] + offsets[None, :]
+    la = np.broadcast_to(la[:, None], lg.shape)
+    mask = (lg >= m) & (lg < maxnl)
+    lg, la = lg[mask], la[mask]
+    order = np.lexsort((la, lg))
+    lg, la = lg[order], la[order]
+    values = coupling_table(kind, maxnl, m, lb)[lg-m, la-m]
+    # the 3j symbol with m != 0 may still vanish inside the band
+    nonzero = values != 0
+    return lg[nonzero], la[nonzero], np.asarray(values[nonzero])
+
+
+def gaunt_coupling(maxnl, m, lb):
+    """
+    Nonzero entries of the K_{alpha, beta, gamma} matrix, with mb = 0, and ma = m, mg = -m
+    :param maxnl: l < maxnl
+    :param lb: l for beta mode
+    :param m: m for alpha mode, -m for gamma mode
+    :return: arrays (lg, la, value), of length O(maxnl * lb)
+    """
+    assert m >= 0
+    return _coupling('gaunt', maxnl, m, lb)
+
+
+def elsasser_coupling(maxnl, m, lb):
+    """
+    Nonzero entries of the L_{alpha, beta, gamma} matrix, with mb = 0, and ma = m, mg = -m
+    :param maxnl: l < maxnl
+    :param lb: l for beta mode
+    :param m: m for alpha mode, -m for gamma mode
+    :return: arrays (lg, la, value), of length O(maxnl * lb)
+    """
+    assert m >= 0
+    return _coupling('elsasser', maxnl, m, lb)
+
+
+def _to_map(mat, maxnl, m):
+    return {(lg, la): mat[i, j] for i, lg in enumerate(range(m, maxnl)) for j, la in enumerate(range(m, maxnl))}
+
+
+def gaunt_matrix(maxnl, m, lb, return_matrix=True, backend='numpy'):
     """
     the K_{alpha, beta, gamma} matrix assumes mb = 0, and ma = m, mg = -m
     :param maxnl: l < maxnl
     :param lb: l for beta mode
     :param m: m for alpha mode, -m for gamma mode
-    :return:
+    :param backend: 'numpy' for the (cached) float64 recursion, 'sympy' for the (slow) symbolic reference
+    :return: read-only matrix indexed [lg-m, la-m], or dict {(lg, la): value} if not return_matrix
     """
     assert m >= 0
     ma, mb, mg = m, 0, -m
-    gmat = np.zeros((maxnl-m, maxnl-m))
-    gmap = {}
-    for i, lg in enumerate(range(m, maxnl)):
-        for j, la in enumerate(range(m, maxnl)):
-            gmat[i, j] = _gaunt(la, lb, lg, m, mb, -m)
-            gmap[(lg, la)] = gmat[i, j]
+    if backend == 'numpy':
+        gmat = coupling_table('gaunt', maxnl, m, lb)
+    elif backend == 'sympy':
+        gmat = np.zeros((maxnl-m, maxnl-m))
+        for i, lg in enumerate(range(m, maxnl)):
+            for j, la in enumerate(range(m, maxnl)):
+                gmat[i, j] = _gaunt(la, lb, lg, m, mb, -m)
+    else:
+        raise RuntimeError(f"Unknown backend {backend}, must be either 'numpy' or 'sympy'.")
     if return_matrix:
         return gmat
     else:
-        return gmap
+        return _to_map(gmat, maxnl, m)
 
 
-def elsasser_matrix(maxnl, m, lb, return_matrix=False):
+def elsasser_matrix(maxnl, m, lb, return_matrix=True, backend='numpy'):
     """
     the L_{alpha, beta, gamma} matrix assumes mb = 0, and ma = m, mg = -m
     :param maxnl: l < maxnl
     :param lb: l for beta mode
     :param m: m for alpha mode, -m for gamma mode
-    :return:
+    :param backend: 'numpy' for the (cached) float64 recursion, 'sympy' for the (slow) symbolic reference
+    :return: read-only matrix indexed [lg-m, la-m], or dict {(lg, la): value} if not return_matrix
     """
     assert m >= 0
     ma, mb, mg = m, 0, -m
-    emat = np.zeros((maxnl - m, maxnl - m), dtype=np.complex128)
-    emap = {}
-    for i, lg in enumerate(range(m, maxnl)):
-        for j, la in enumerate(range(m, maxnl)):
-            emat[i, j] = _elsasser(la, lb, lg, m, mb, -m)
-            emap[(lg, la)] = emat[i, j]
+    if backend == 'numpy':
+        emat = coupling_table('elsasser', maxnl, m, lb)
+    elif backend == 'sympy':
+        emat = np.zeros((maxnl - m, maxnl - m), dtype=np.complex128)
+        for i, lg in enumerate(range(m, maxnl)):
+            for j, la in enumerate(range(m, maxnl)):
+                emat[i, j] = _elsasser(la, lb, lg, m, mb, -m)
+    else:
+        raise RuntimeError(f"Unknown backend {backend}, must be either 'numpy' or 'sympy'.")
     if return_matrix:
         return emat
     else:
-        return emap
+        return _to_map(emat, maxnl, m)
 
 
 if __name__ == "__main__":
@@ -74,6 +368,8 @@ if __name__ == "__main__":
         maxnl, m, lb = 11, 1, 1
         g = gaunt_matrix(maxnl, m, lb, return_matrix=True)
         e = elsasser_matrix(maxnl, m, lb, return_matrix=True)
+    print(np.abs(g - gaunt_matrix(maxnl, m, lb, return_matrix=True, backend='sympy')).max())
+    print(np.abs(e - elsasser_matrix(maxnl, m, lb, return_matrix=True, backend='sympy')).max())
     fig, (ax1, ax2) = plt.subplots(figsize=(10, 4.5), ncols=2)
     ax1.spy(g)
     ax2.spy(e)
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from operators.worland_transform import WorlandTransform
+from operators.associated_legendre_transform import AssociatedLegendreTransformSingleM
+
+
+def _grid_key(grid):
+    if grid is None:
+        return None
+    grid = np.ascontiguousarray(grid, dtype=np.float64)
+    return grid.shape, hash(grid.tobytes())
+
+
+def _arrays(obj):
+    """ the numpy tables held by a transform """
+    for value in vars(obj).values():
+        if isinstance(value, np.ndarray):
+            yield value
+        elif isinstance(value, dict):
+            yield from (v for v in value.values() if isinstance(v, np.ndarray))
+
+
+def _nbytes(obj):
+    """ memory held by a transform, including the caches it builds on use if it reports them """
+    if hasattr(obj, 'nbytes'):
+        return obj.nbytes()
+    return sum(array.nbytes for array in _arrays(obj))
+
+
+@dataclass
+class TransformRegistry:
+    """
+    Process-wide cache of transforms keyed by resolution and grid, so that identical polynomial tables are only
+    computed once. The transforms are shared, their tables are set read-only.
+    Their size is measured again on every access, as they keep caching operators built on use, e.g. the curl blocks of
+    WorlandTransform; an evicted transform drops these caches.
+
+    Parameters
+    -----
+    max_bytes: upper bound of the memory held by the transforms, the least recently used transforms are evicted first
+    """
+    max_bytes: int = 2 ** 30
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+
+    def __post_init__(self):
+        self._transforms = OrderedDict()
+
+    @property
+    def nbytes(self):
+        return sum(_nbytes(transform) for transform in self._transforms.values())
+
+    def _get(self, key, build):
+        if key in self._transforms:
+            self.hits += 1
+            self._transforms.move_to_end(key)
+            transform = self._transforms[key]
+        else:
+            self.misses += 1
+            transform = build()
+            for array in _arrays(transform):
+                array.flags.writeable = False
+            self._transforms[key] = transform
+        self._evict()
+        return transform
+
+    def _evict(self):
+        """ evict the least recently used transforms until the rest fit in max_bytes, keeping the last one used """
+        nbytes = self.nbytes
+        while len(self._transforms) > 1 and nbytes > self.max_bytes:
+            _, transform = self._transforms.popitem(last=False)
+            nbytes -= _nbytes(transform)
+            if hasattr(transform, 'clear_cache'):
+                transform.clear_cache()
+
+    def worland(self, nr, maxnl, m, n_grid=None, r_grid=None, require_curl=True) -> WorlandTransform:
+        """ shared WorlandTransform, same arguments as the class """
+        if r_grid is not None:
+            n_grid, r_grid = None, np.array(r_grid, dtype=np.float64)
+        key = ('worland', nr, maxnl, m, n_grid, _grid_key(r_grid), require_curl)
+        return self._get(key, lambda: WorlandTransform(nr, maxnl, m, n_grid, r_grid, require_curl=require_curl))
+
+    def legendre(self, maxnl, m, grid) -> AssociatedLegendreTransformSingleM:
+        """ shared AssociatedLegendreTransformSingleM, same arguments as the class """
+        grid = np.array(grid, dtype=np.float64)
+        key = ('legendre', maxnl, m, _grid_key(grid))
+        return self._get(key, lambda: AssociatedLegendreTransformSingleM(maxnl, m, grid))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'transforms': len(self._transforms), 'nbytes': self.nbytes}
+
+    def clear(self):
+        self._transforms.clear()
+        self.hits, self.misses = 0, 0
+
+
+registry = TransformRegistry()
+
+
+def worland_transform(nr, maxnl, m, n_grid=None, r_grid=None, require_curl=True) -> WorlandTransform:
+    return registry.worland(nr, maxnl, m, n_grid, r_grid, require_curl)
+
+
+def legendre_transform(maxnl, m, grid) -> AssociatedLegendreTransformSingleM:
+    return registry.legendre(maxnl, m, grid)
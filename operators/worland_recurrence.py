@@ -1,10 +1,11 @@
+from functools import lru_cache
 import numpy as np
 from numba import njit
 
 import quicc.geometry.worland.worland_basis as wb
 
 
-@njit
+@njit(cache=True)
 def jacobiP(nr, a, b, x, coe):
     w = np.full((x.shape[0], nr), fill_value=np.NaN)
     w[:, 0] = coe
@@ -20,7 +21,7 @@ def jacobiP(nr, a, b, x, coe):
     return w
 
 
-@njit
+@njit(cache=True)
 def DjacobiP(nr, a, b, x, coe):
     if nr < 2:
         return np.zeros((x.shape[0], nr))
@@ -32,7 +33,7 @@ def DjacobiP(nr, a, b, x, coe):
         return dp
 
 
-@njit
+@njit(cache=True)
 def D2jacobiP(nr, a, b, x, coe):
     if nr < 3:
         return np.zeros((x.shape[0], nr))
@@ -44,57 +45,151 @@ def D2jacobiP(nr, a, b, x, coe):
         return d2p
 
 
+# P_n^{(a, b)} is carried as mantissa * _SCALE**exponent, the mantissa being rescaled once it exceeds _SCALE
+_SCALE = 2.0 ** 512
+_LOG_SCALE = 512 * np.log(2.0)
+
+# families of operators on W_n^l = norm_n r^l P_n^{(-1/2, l-1/2)}(2r^2-1), as terms (c, p, k) meaning
+# c r^(l+p) d^k P / dx^k, with coefficients c depending on l
+_FAMILIES = {
+    'W': lambda l: [(1.0, 0, 0)],
+    'divrW': lambda l: [(1.0 if l >= 1 else 0.0, -1, 0)],
+    'divrdiffrW': lambda l: [(l+1.0, -1, 0), (4.0, 1, 1)],
+    'diff2rW': lambda l: [(l*(l+1.0), -1, 0), (4.0*(2*l+3), 1, 1), (16.0, 3, 2)],
+    'laplacianlW': lambda l: [(8.0*l+12.0, 0, 1), (16.0, 2, 2)],
+}
+
+
+@njit(cache=True)
+def _scaled_jacobi_all_l(nr, a, b, x):
+    """
+    P_n^{(a, b_l)}(x) for all b_l as mantissa and exponent arrays of shape (L, n_grid, nr), P = mantissa * _SCALE**exponent.
+    Same recurrence as jacobiP, the running pair is rescaled by an exact power of 2 whenever it grows past _SCALE,
+    so that P does not overflow for large n and b.
+    """
+    w = np.zeros((b.shape[0], x.shape[0], nr))
+    e = np.zeros((b.shape[0], x.shape[0], nr), dtype=np.int64)
+    for i in range(b.shape[0]):
+        bi = b[i]
+        for j in range(x.shape[0]):
+            ex = 0
+            prev, cur = 0.0, 1.0
+            for n in range(nr):
+                if n == 1:
+                    prev, cur = cur, 0.5 * (a-bi+(2+a+bi)*x[j])
+                elif n > 1:
+                    an = 2*n*(n+a+bi)*(2*n+a+bi-2)
+                    bn = (2*n+a+bi-1)*(2*n+a+bi)*(2*n+a+bi-2)
+                    cn = (2*n+a+bi-1)*(a**2-bi**2)
+                    dn = -2*(n+a-1)*(n+bi-1)*(2*n+a+bi)
+                    prev, cur = cur, ((bn*x[j]+cn)*cur + dn*prev) / an
+                if abs(cur) > _SCALE:
+                    prev, cur = prev / _SCALE, cur / _SCALE
+                    ex += 1
+                w[i, j, n] = cur
+                e[i, j, n] = ex
+    return w, e
+
+
+@njit(cache=True)
+def _power(rg, q):
+    """
+    r^q on the grid, with the limits at r = 0: 1 for q = 0, and inf for q < 0, which only occurs in the l = 0 term of
+    divrdiffrW, singular at the origin
+    """
+    rp = np.empty(rg.shape[0])
+    for j in range(rg.shape[0]):
+        if rg[j] != 0:
+            rp[j] = rg[j] ** q
+        elif q > 0:
+            rp[j] = 0.0
+        elif q == 0:
+            rp[j] = 1.0
+        else:
+            rp[j] = np.inf
+    return rp
+
+
+@njit(cache=True)
+def _accumulate(out, c, p, k, mantissa, exponent, ls, rg, norms):
+    """ out[i, :, n] += c[i] norm_n r^(l+p) d^k P_n / dx^k, for all l = ls[i] """
+    log_r = np.log(np.where(rg > 0, rg, 1.0))
+    for i in range(ls.shape[0]):
+        if c[i] == 0:
+            continue
+        l = ls[i]
+        rp = _power(rg, l + p)
+        for n in range(k, out.shape[2]):
+            # d^k P_n^{(a, b)} = kfac P_{n-k}^{(a+k, b+k)}, with a + b = l - 1
+            kfac = 1.0
+            for q in range(k):
+                kfac *= 0.5 * (l + n + q)
+            coe = c[i] * norms[i, n] * kfac
+            for j in range(rg.shape[0]):
+                ex = exponent[i, j, n-k]
+                if ex == 0:
+                    out[i, j, n] += coe * rp[j] * mantissa[i, j, n-k]
+                elif rg[j] == 0:
+                    # no log r at the origin, r^(l+p) is 0, 1 or inf
+                    if rp[j] != 0:
+                        out[i, j, n] += np.copysign(np.exp(np.log(abs(coe)) + ex * _LOG_SCALE), coe) * rp[j] * \
+                            mantissa[i, j, n-k]
+                else:
+                    out[i, j, n] += coe * np.exp((l + p) * log_r[j] + ex * _LOG_SCALE) * mantissa[i, j, n-k]
+
+
+@lru_cache(maxsize=None)
+def _norms(nr, l):
+    return np.array([wb.worland_norm(n, l) for n in range(nr)])
+
+
+def worland_operators(nr, ls, rg, families=None):
+    """
+    worland, divrW, divrdiffrW, diff2rW and laplacianlW for all l in ls in a single pass, sharing the Jacobi
+    recurrences, returned as a dict of contiguous (L, n_grid, nr) arrays.
+    The recurrences are rescaled to avoid overflow, so that nr and l up to ~1000 can be evaluated.
+    :param families: names of the operators to compute, default is all of them
+    """
+    if families is None:
+        families = list(_FAMILIES.keys())
+    ls = np.asarray(ls, dtype=np.int64).reshape(-1)
+    rg = np.asarray(rg, dtype=np.float64)
+    norms = np.array([_norms(nr, l) for l in ls]).reshape(ls.shape[0], nr)
+    terms = {name: [_FAMILIES[name](l) for l in ls] for name in families}
+    orders = {term[2] for name in families for term in _FAMILIES[name](1)}
+    # P^{(a, b)}, and P^{(a+1, b+1)}, P^{(a+2, b+2)} for the derivatives, only those needed
+    jacobi = {k: _scaled_jacobi_all_l(max(nr-k, 0), -0.5+k, ls-0.5+k, 2*rg**2-1) for k in orders}
+    ops = {}
+    for name in families:
+        out = np.zeros((ls.shape[0], rg.shape[0], nr))
+        for t in range(len(terms[name][0])):
+            c = np.array([terms[name][i][t][0] for i in range(ls.shape[0])])
+            _, p, k = terms[name][0][t]
+            _accumulate(out, c, p, k, *jacobi[k], ls, rg, norms)
+        ops[name] = out
+    return ops
+
+
 def worland(nr, l, rg):
     """W(r)"""
-    w = jacobiP(nr, -0.5, l-0.5, 2*rg**2-1, rg**l)
-    for n in range(nr):
-        w[:, n] *= wb.worland_norm(n, l)
-    return w
+    return worland_operators(nr, [l], rg, ['W'])['W'][0]
 
 
 def divrW(nr, l, rg):
     """W(r)/r"""
-    if l >= 1:
-        divrw = jacobiP(nr, -0.5, l-0.5, 2*rg**2-1, rg**(l-1))
-        for n in range(nr):
-            divrw[:, n] *= wb.worland_norm(n, l)
-        return divrw
-    else:
-        return np.zeros((rg.shape[0], nr))
+    return worland_operators(nr, [l], rg, ['divrW'])['divrW'][0]
 
 
 def divrdiffrW(nr, l, rg):
     """1/r D r W(r) """
-    a, b = -0.5, l-0.5
-    p = jacobiP(nr, a, b, 2*rg**2-1, (l+1)*rg**(l-1))
-    dp = DjacobiP(nr, a, b, 2*rg**2-1, 4*rg**(l+1))
-    divrdiffrw = p + dp
-    for n in range(nr):
-        divrdiffrw[:, n] *= wb.worland_norm(n, l)
-    return divrdiffrw
+    return worland_operators(nr, [l], rg, ['divrdiffrW'])['divrdiffrW'][0]
 
 
 def diff2rW(nr, l, rg):
     """ D^2 r W_n^l(r) """
-    a, b = -0.5, l-0.5
-    diff2w = DjacobiP(nr, a, b, 2*rg**2-1, 4*(2*l+3)*rg**(l+1)) + D2jacobiP(nr, a, b, 2*rg**2-1, 16*rg**(l+3))
-    if l > 0:
-        diff2w += jacobiP(nr, a, b, 2*rg**2-1, l*(l+1) * rg**(l-1))
-    for n in range(nr):
-        diff2w[:, n] *= wb.worland_norm(n, l)
-    return diff2w
+    return worland_operators(nr, [l], rg, ['diff2rW'])['diff2rW'][0]
 
 
 def laplacianlW(nr, l, rg):
     """ 1/r^2 D(r^2 D ) - l(l+1)/r^2 W_n^l(r) """
-    a, b = -0.5, l - 0.5
-    laplw = D2jacobiP(nr, a, b, 2*rg**2-1, 16.0 * rg**(l+2)) + DjacobiP(nr, a, b, 2*rg**2-1, (8.0*l+12.0) * rg**l)
-    for n in range(nr):
-        laplw[:, n] *= wb.worland_norm(n, l)
-    return laplw
-
-
-# warmer
-jacobiP(2, -0.5, 0.5, np.linspace(0,1,4), np.linspace(-1,1,4))
-DjacobiP(2, -0.5, 0.5, np.linspace(0, 1, 4), np.linspace(-1, 1, 4))
-D2jacobiP(2, -0.5, 0.5, np.linspace(0, 1, 4), np.linspace(-1, 1, 4))
+    return worland_operators(nr, [l], rg, ['laplacianlW'])['laplacianlW'][0]
@@ -1,11 +1,51 @@
+from collections import OrderedDict
 from dataclasses import dataclass, field
-import matplotlib.pyplot as plt
-from typing import List, Dict, Tuple
+from functools import wraps
+from typing import List, Tuple, Union, Callable
 
 from operators.polynomials import *
-from operators.threeJ_integrals import gaunt_matrix, elsasser_matrix
+from operators.threeJ_integrals import gaunt_coupling, elsasser_coupling
 from utils import Timer
 
+# a single background mode, or a list of them whose contributions are summed
+Modes = Union[SphericalHarmonicMode, List[SphericalHarmonicMode]]
+
+
+def l2(l):
+    return l * (l + 1)
+
+
+def parity_sign(n):
+    """ (-1)**n for integer arrays, also for negative n """
+    return 1 - 2 * (n % 2)
+
+
+def _sparse_nbytes(mat):
+    return sum(getattr(mat, attr).nbytes for attr in ('data', 'indices', 'indptr', 'row', 'col') if hasattr(mat, attr))
+
+
+def memoized_block(curl_op):
+    """
+    cache the assembled operator of curl_op per (operator name, identity of the beta modes) on the transform,
+    the cached sparse matrices are shared between callers and must not be modified in place.
+    At most max_blocks operators are kept, the least recently used are dropped first.
+    """
+    name = curl_op.__name__
+
+    @wraps(curl_op)
+    def wrapper(self, beta_mode, parity=None):
+        modes = beta_mode if isinstance(beta_mode, (list, tuple)) else [beta_mode]
+        key = (name, tuple(mode.key for mode in modes), parity)
+        if key in self._blocks:
+            self._blocks.move_to_end(key)
+            return self._blocks[key]
+        block = curl_op(self, beta_mode, parity)
+        self._blocks[key] = block
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+        return block
+    return wrapper
+
 
 @dataclass
 class WorlandTransform:
@@ -27,6 +67,14 @@ class WorlandTransform:
 
     require_curl: whether compute operators Laplacian_l W_n^l(r)
 
+    pair_chunk: number of (lg, la) blocks computed in one batched matmul
+
+    max_blocks: number of assembled curl operators kept in memory, see memoized_block
+
+    All curl operators take an optional parity = (row, col), the values of (l+m) % 2 kept for the gamma (row)
+    and alpha (column) modes, None keeping all l. Only the couplings between these l are assembled, and the
+    restricted operator is indexed by the kept l in ascending order.
+
     """
     nr: int
     maxnl: int
@@ -34,6 +82,8 @@ class WorlandTransform:
     n_grid: int = None
     r_grid: np.ndarray = field(repr=False, default=None)
     require_curl: bool = True
+    pair_chunk: int = field(repr=False, default=256)
+    max_blocks: int = field(repr=False, default=128)
 
     def __post_init__(self):
         self.res = self.nr, self.maxnl, self.m
@@ -45,6 +95,9 @@ class WorlandTransform:
             self.n_grid = self.r_grid.shape[0]
         self.weight = np.ones(self.n_grid) * worland_weight(self.n_grid)
 
+        # assembled curl operators, see memoized_block
+        self._blocks = OrderedDict()
+
         # init operators
         self._init_operators()
         if self.require_curl:
@@ -53,254 +106,257 @@ class WorlandTransform:
     def _init_operators(self, ):
         nr, maxnl, m = self.res
         r_grid = self.r_grid
-        self.operators = {}
+        # each family is a contiguous (L, n_grid, nr) array of the per-l blocks, see sparse for a block diagonal view
+        self.operators = worland_operators(nr, np.arange(m, maxnl), r_grid)
         self.transformers = {}
-        self.operators['W'] = []
-        self.operators['divrW'] = []
-        self.operators['divrdiffrW'] = []
-        self.operators['diff2rW'] = []
-        self.operators['laplacianlW'] = []
-        for l in range(m, maxnl):
-            mat = worland(nr, l, r_grid)
-            self.operators['W'].append(mat)
-            self.operators['divrW'].append(divrW(nr, l, r_grid))
-            self.operators['divrdiffrW'].append(divrdiffrW(nr, l, r_grid))
-            self.operators['diff2rW'].append(diff2rW(nr, l, r_grid))
-            self.operators['laplacianlW'].append(laplacianlW(nr, l, r_grid))
-        for k, v in self.operators.items():
-            self.operators[k] = scsp.csc_matrix(scsp.block_diag(v))
+        self._sparse = {}
+        self._products = {}
 
     def _init_curl_op(self):
+        W = self.operators['W']
+        self.transformers['curl'] = np.matmul(W.transpose(0, 2, 1) * self.weight, self.operators['laplacianlW'])
+
+    def sparse(self, name: str):
+        """ block diagonal csc matrix of an operator or transformer, built on first use """
+        if name not in self._sparse:
+            blocks = self.operators[name] if name in self.operators else self.transformers[name]
+            self._sparse[name] = scsp.csc_matrix(scsp.block_diag(list(blocks)))
+        return self._sparse[name]
+
+    def to_grid(self, name: str, spectrum: np.ndarray):
+        """
+        apply operator name to spectral coefficients ordered by l then n, (L*nr,) or (L*nr, k),
+        returning values on the radial grid of shape (L, n_grid) or (L, n_grid, k)
+        """
         nr, maxnl, m = self.res
-        weight = scsp.kron(scsp.identity(maxnl-m), scsp.diags(self.weight))
-        self.transformers['curl'] = self.operators['W'].T @ weight @ self.operators['laplacianlW']
-
-    @staticmethod
-    def _compute_block_numba1(left_op, right_op, weight, factor_mat):
-        weight = scsp.kron(factor_mat, weight)
-        return left_op.T @ weight @ right_op
-
-    @staticmethod
-    def _compute_block_numba2(left_op, right_op, transformer, weight, factor_mat):
-        weight = scsp.kron(factor_mat, weight)
-        return left_op.T @ weight @ right_op @ transformer
-
-    def _compute_block(self, beta_mode: SphericalHarmonicMode, sh_factor: Dict, terms: List[Tuple]):
-        """ compute matrix for all l """
+        coe = spectrum.reshape(maxnl - m, nr, -1)
+        values = np.matmul(self.operators[name], coe)
+        return values[..., 0] if spectrum.ndim == 1 else values
+
+    def _right_operator(self, alpha_op: str, transformer: str = None):
+        """ dense (L, n_grid, nr) operator acting on the alpha mode, Op[l] @ transformer[l] if a transformer is given """
+        if transformer is None:
+            return self.operators[alpha_op]
+        key = (alpha_op, transformer)
+        if key not in self._products:
+            self._products[key] = np.matmul(self.operators[alpha_op], self.transformers[transformer])
+        return self._products[key]
+
+    def _l_index(self, ls, parity):
+        """ position of ls among the degrees l >= m with (l+m) % 2 == parity, or among all l if parity is None """
+        m = self.m
+        return ls - m if parity is None else (ls - m - parity) // 2
+
+    def _shape(self, parity: Tuple = None):
+        """ shape of a curl operator restricted to parity = (row, col) """
+        nr, maxnl, m = self.res
+        row, col = (None, None) if parity is None else parity
+        n_l = [maxnl - m if p is None else len(range(m + p, maxnl, 2)) for p in (row, col)]
+        return nr * n_l[0], nr * n_l[1]
+
+    def _compute_block(self, beta_modes: List[SphericalHarmonicMode], sh_factor: Tuple, terms: List[Tuple],
+                       parity: Tuple = None):
+        """
+        compute matrix for all l, visiting only the (lg, la) pairs of nonzero sh_factor = (lg, la, value).
+        All beta_modes share the same l, their radial profiles are summed before the quadrature.
+        Each block W[lg].T @ diag(weight*radial) @ Op[la] is one batched matmul over the pairs; terms sharing
+        the same Op are merged into a single quadrature weight first.
+        """
         nr, maxnl, m = self.res
-        lb = beta_mode.l
-        mat = scsp.csc_matrix((nr*(maxnl-m), nr*(maxnl-m)))
+        shape = self._shape(parity)
+        lb = beta_modes[0].l
+        lgs, las, coe = sh_factor
+        row, col = (None, None) if parity is None else parity
+        if row is not None or col is not None:
+            keep = np.ones(lgs.shape, dtype=bool)
+            if row is not None:
+                keep &= (lgs - m) % 2 == row
+            if col is not None:
+                keep &= (las - m) % 2 == col
+            lgs, las, coe = lgs[keep], las[keep], coe[keep]
+        n_pair = lgs.shape[0]
+        if n_pair == 0:
+            return scsp.csc_matrix(shape)
+
+        # factor functions act elementwise on the (la, lg) arrays of the nonzero pairs
+        # quadrature weights, (n_pair, n_grid), per right operator
+        weights = {}
         for term in terms:
             if len(term) == 3:
                 beta_op, alpha_op, factor = term
                 transformer = None
             else:
                 beta_op, alpha_op, factor, transformer = term
-            radial = beta_op.apply(beta_mode.radial_expr, self.r_grid)
-            # weight = np.diag(self.weight * radial)
-            weight = scsp.diags(self.weight * radial)
-            factor_mat = np.zeros((maxnl-m, maxnl-m), dtype=np.complex128)
-            for i, lg in enumerate(range(m, maxnl)):
-                for j, la in enumerate(range(m, maxnl)):
-                    factor_mat[i, j] = factor(la, lb, lg) * sh_factor[(lg, la)]
-
-            if transformer is None:
-                mat += self._compute_block_numba1(self.operators['W'], self.operators[alpha_op], weight, factor_mat)
-            else:
-                mat += self._compute_block_numba2(self.operators['W'], self.operators[alpha_op],
-                                                         self.transformers[transformer], weight, factor_mat)
-        return mat
-
-    def curl1tt(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        dim = (maxnl - m) * nr
-        return scsp.csc_matrix((dim, dim))
-
-    def curl1st(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        if beta_mode.comp == 'tor':
-            lb = beta_mode.l
-            sh_factor = elsasser_matrix(maxnl, m, lb, return_matrix=False)
-
-            def factor_func(la, lb, lg): return la*(la+1)
-            terms = [(SymDivr(), 'W', factor_func)]
-            return self._compute_block(beta_mode, sh_factor, terms)
-        else:
-            dim = (maxnl - m) * nr
-            return scsp.csc_matrix((dim, dim))
-
-    def curl1ts(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        if beta_mode.comp == 'pol':
-            lb = beta_mode.l
-            sh_factor = elsasser_matrix(maxnl, m, lb, return_matrix=False)
-
-            def factor_func(la, lb, lg): return lb * (lb + 1) * (-1) ** (la+lb+lg-1)
-            terms = [(SymDivr(), 'W', factor_func)]
-            return self._compute_block(beta_mode, sh_factor, terms)
-        else:
-            dim = (maxnl - m) * nr
-            return scsp.csc_matrix((dim, dim))
+            radial = sum(mode.radial_profile(beta_op, self.r_grid) for mode in beta_modes)
+            values = np.broadcast_to(factor(las, lb, lgs), lgs.shape) * coe
+            key = (alpha_op, transformer)
+            weights[key] = weights.get(key, 0) + np.outer(values, self.weight * radial)
+
+        left = self.operators['W'].transpose(0, 2, 1)
+        blocks = np.zeros((n_pair, nr, nr), dtype=np.complex128)
+        for (alpha_op, transformer), weight in weights.items():
+            right = self._right_operator(alpha_op, transformer)
+            # real GEMMs only, chunked over the pairs to bound the (chunk, nr, n_grid) intermediate
+            for a in range(0, n_pair, self.pair_chunk):
+                b = min(a + self.pair_chunk, n_pair)
+                ig, ia = lgs[a:b] - m, las[a:b] - m
+                w = weight[a:b, None, :]
+                if np.any(w.real):
+                    blocks[a:b] += np.matmul(left[ig] * w.real, right[ia])
+                if np.any(w.imag):
+                    blocks[a:b] += 1.0j * np.matmul(left[ig] * w.imag, right[ia])
+
+        rows = self._l_index(lgs, row)[:, None, None] * nr + np.arange(nr)[None, :, None]
+        cols = self._l_index(las, col)[:, None, None] * nr + np.arange(nr)[None, None, :]
+        rows, cols = np.broadcast_arrays(rows, cols)
+        mat = scsp.coo_matrix((blocks.ravel(), (rows.ravel(), cols.ravel())), shape=shape)
+        return mat.tocsc()
+
+    def clear_cache(self):
+        """
+        drop all memoized curl operators, e.g. after the background modes were changed in place,
+        and the sparse views and operator products built on use
+        """
+        self._blocks.clear()
+        self._sparse.clear()
+        self._products.clear()
+
+    def nbytes(self):
+        """ memory held by the operator tables and the caches built on use """
+        tables = [self.weight, *self.operators.values(), *self.transformers.values(), *self._products.values()]
+        matrices = [*self._sparse.values(), *self._blocks.values()]
+        return sum(table.nbytes for table in tables) + sum(_sparse_nbytes(mat) for mat in matrices)
 
-    def curl1ss(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        def l2(l): return l*(l+1)
-        if beta_mode.comp == 'pol':
-            lb = beta_mode.l
-            sh_factor = gaunt_matrix(maxnl, m, lb, return_matrix=False)
-
-            def factor_func1(la, lb, lg): return 0.5*l2(la)*(l2(la)-l2(lb)-l2(lg))
-            def factor_func2(la, lb, lg): return 0.5*l2(lb)*(l2(la)-l2(lb)+l2(lg))
-            terms = [(SymDivrDiffr(), 'divrW', factor_func1),
-                     (SymDivr(), 'divrdiffrW', factor_func2)]
-            return self._compute_block(beta_mode, sh_factor, terms)
-        else:
-            dim = (maxnl - m) * nr
-            return scsp.csc_matrix((dim, dim))
-
-    def curl2tt(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        if beta_mode.comp == 'tor':
-            lb = beta_mode.l
-            sh_factor = elsasser_matrix(maxnl, m, lb, return_matrix=False)
-
-            def factor_func(la, lb, lg): return lg * (lg + 1)
-            terms = [(SymDivr(), 'W', factor_func)]
-            return self._compute_block(beta_mode, sh_factor, terms)
-        else:
-            dim = (maxnl - m) * nr
-            return scsp.csc_matrix((dim, dim))
-
-    def curl2st(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        def l2(l): return l * (l + 1)
-        if beta_mode.comp == 'tor':
-            lb = beta_mode.l
-            sh_factor = gaunt_matrix(maxnl, m, lb, return_matrix=False)
-
-            def factor_func1(la, lb, lg):
-                return -0.5 * l2(lg) * (l2(la) + l2(lb) - l2(lg)) + 0.5 * l2(la) * (l2(la) - l2(lb) - l2(lg))
-
-            def factor_func2(la, lb, lg): return 0.5 * l2(la) * (l2(la) - l2(lb) - l2(lg))
-
-            terms = [(SymDivr(), 'divrdiffrW', factor_func1),
-                     (SymDiffDivr(), 'W', factor_func2)]
-            return self._compute_block(beta_mode, sh_factor, terms)
-        else:
-            dim = (maxnl - m) * nr
-            return scsp.csc_matrix((dim, dim))
-
-    def curl2ts(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        def l2(l): return l * (l + 1)
-        if beta_mode.comp == 'pol':
-            lb = beta_mode.l
-            sh_factor = gaunt_matrix(maxnl, m, lb, return_matrix=False)
-
-            def factor_func1(la, lb, lg): return 0.5 * l2(lg) * (l2(la) + l2(lb) - l2(lg))
-            def factor_func2(la, lb, lg): return -0.5 * l2(lb) * (-l2(la) + l2(lb) - l2(lg))
-
-            terms = [(SymDivrDiffr(), 'divrW', factor_func1),
-                     (SymDivr(), 'divrdiffrW', factor_func2),
-                     (SymDiffDivr(), 'W', factor_func2)]
-            return self._compute_block(beta_mode, sh_factor, terms)
-        else:
-            dim = (maxnl - m) * nr
-            return scsp.csc_matrix((dim, dim))
-
-    def curl2ss(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        def l2(l): return l * (l + 1)
-        if beta_mode.comp == 'pol':
-            lb = beta_mode.l
-            sh_factor = elsasser_matrix(maxnl, m, lb, return_matrix=False)
-
-            def factor_func1(la, lb, lg): return -l2(la)
-            def factor_func2(la, lb, lg): return -l2(lb)
-            def factor_func3(la, lb, lg): return l2(lg)
-
-            terms = [
-                     (SymDivr2Diffr(), 'divrdiffrW', factor_func1),
-                     (SymrDiffDivr2Diffr(), 'divrW', factor_func1),
-                     (SymDivr2(), 'diff2rW', factor_func2),
-                     (SymDiffDivr(), 'divrdiffrW', factor_func2),
-                     (SymDivr2Diffr(), 'divrdiffrW', factor_func3)
-                     ]
-            return self._compute_block(beta_mode, sh_factor, terms)
-        else:
-            dim = (maxnl - m) * nr
-            return scsp.csc_matrix((dim, dim))
-
-    def curl1curltt(self, beta_mode: SphericalHarmonicMode):
-        return self.curl1st(beta_mode)
-
-    def curl1curlts(self, beta_mode: SphericalHarmonicMode):
-        return self.curl1ss(beta_mode)
-
-    def curl2curltt(self, beta_mode: SphericalHarmonicMode):
-        return self.curl2st(beta_mode)
-
-    def curl2curlts(self, beta_mode: SphericalHarmonicMode):
-        return self.curl2ss(beta_mode)
-
-    def curl1curlst(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        dim = (maxnl - m) * nr
-        return scsp.csc_matrix((dim, dim))
-
-    def curl1curlss(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        if beta_mode.comp == 'pol':
-            lb = beta_mode.l
-            sh_factor = elsasser_matrix(maxnl, m, lb, return_matrix=False)
-
-            def factor_func(la, lb, lg):
-                return -lb * (lb + 1) * (-1) ** (la + lb + lg - 1)
-
-            terms = [(SymDivr(), 'laplacianlW', factor_func)]
-            return self._compute_block(beta_mode, sh_factor, terms)
-        else:
-            dim = (maxnl - m) * nr
-            return scsp.csc_matrix((dim, dim))
-
-    def curl2curlst(self, beta_mode: SphericalHarmonicMode):
-        nr, maxnl, m = self.res
-        if beta_mode.comp == 'tor':
-            lb = beta_mode.l
-            sh_factor = elsasser_matrix(maxnl, m, lb, return_matrix=False)
-
-            def factor_func(la, lb, lg):
-                return -lg * (lg + 1)
-
-            terms = [(SymDivr(), 'laplacianlW', factor_func)]
-            return self._compute_block(beta_mode, sh_factor, terms)
-        else:
-            dim = (maxnl - m) * nr
-            return scsp.csc_matrix((dim, dim))
-
-    def curl2curlss(self, beta_mode: SphericalHarmonicMode):
+    @staticmethod
+    def _group_modes(beta_modes: Modes, comp: str):
+        """ modes of component comp, grouped by l """
+        if not isinstance(beta_modes, (list, tuple)):
+            beta_modes = [beta_modes]
+        groups = {}
+        for mode in beta_modes:
+            if mode.comp == comp:
+                groups.setdefault(mode.l, []).append(mode)
+        return groups
+
+    def _assemble(self, beta_modes: Modes, comp: str, coupling: Callable, terms: List[Tuple], parity: Tuple = None):
+        """ sum of the blocks of all beta modes of component comp, one quadrature per distinct l """
         nr, maxnl, m = self.res
-        def l2(l): return l * (l + 1)
-
-        if beta_mode.comp == 'pol':
-            lb = beta_mode.l
-            sh_factor = gaunt_matrix(maxnl, m, lb, return_matrix=False)
-
-            def factor_func1(la, lb, lg):
-                return -0.5 * l2(lg) * (l2(la) + l2(lb) - l2(lg))
-            def factor_func2(la, lb, lg):
-                return +0.5 * l2(lb) * (-l2(la) + l2(lb) - l2(lg))
+        mat = scsp.csc_matrix(self._shape(parity))
+        for lb, modes in self._group_modes(beta_modes, comp).items():
+            mat += self._compute_block(modes, coupling(maxnl, m, lb), terms, parity)
+        return mat
 
-            terms = [(SymDivrDiffr(), 'divrW', factor_func1, 'curl'),
-                     (SymDivr(), 'divrdiffrW', factor_func2, 'curl'),
-                     (SymDiffDivr(), 'laplacianlW', factor_func2)]
-            return self._compute_block(beta_mode, sh_factor, terms)
-        else:
-            dim = (maxnl - m) * nr
-            return scsp.csc_matrix((dim, dim))
+    def curl1tt(self, beta_mode: Modes, parity: Tuple = None):
+        return scsp.csc_matrix(self._shape(parity))
+
+    @memoized_block
+    def curl1st(self, beta_mode: Modes, parity: Tuple = None):
+        def factor_func(la, lb, lg): return l2(la)
+        terms = [(SymDivr(), 'W', factor_func)]
+        return self._assemble(beta_mode, 'tor', elsasser_coupling, terms, parity)
+
+    @memoized_block
+    def curl1ts(self, beta_mode: Modes, parity: Tuple = None):
+        def factor_func(la, lb, lg): return l2(lb) * parity_sign(la+lb+lg-1)
+        terms = [(SymDivr(), 'W', factor_func)]
+        return self._assemble(beta_mode, 'pol', elsasser_coupling, terms, parity)
+
+    @memoized_block
+    def curl1ss(self, beta_mode: Modes, parity: Tuple = None):
+        def factor_func1(la, lb, lg): return 0.5*l2(la)*(l2(la)-l2(lb)-l2(lg))
+        def factor_func2(la, lb, lg): return 0.5*l2(lb)*(l2(la)-l2(lb)+l2(lg))
+        terms = [(SymDivrDiffr(), 'divrW', factor_func1),
+                 (SymDivr(), 'divrdiffrW', factor_func2)]
+        return self._assemble(beta_mode, 'pol', gaunt_coupling, terms, parity)
+
+    @memoized_block
+    def curl2tt(self, beta_mode: Modes, parity: Tuple = None):
+        def factor_func(la, lb, lg): return l2(lg)
+        terms = [(SymDivr(), 'W', factor_func)]
+        return self._assemble(beta_mode, 'tor', elsasser_coupling, terms, parity)
+
+    @memoized_block
+    def curl2st(self, beta_mode: Modes, parity: Tuple = None):
+        def factor_func1(la, lb, lg):
+            return -0.5 * l2(lg) * (l2(la) + l2(lb) - l2(lg)) + 0.5 * l2(la) * (l2(la) - l2(lb) - l2(lg))
+
+        def factor_func2(la, lb, lg): return 0.5 * l2(la) * (l2(la) - l2(lb) - l2(lg))
+
+        terms = [(SymDivr(), 'divrdiffrW', factor_func1),
+                 (SymDiffDivr(), 'W', factor_func2)]
+        return self._assemble(beta_mode, 'tor', gaunt_coupling, terms, parity)
+
+    @memoized_block
+    def curl2ts(self, beta_mode: Modes, parity: Tuple = None):
+        def factor_func1(la, lb, lg): return 0.5 * l2(lg) * (l2(la) + l2(lb) - l2(lg))
+        def factor_func2(la, lb, lg): return -0.5 * l2(lb) * (-l2(la) + l2(lb) - l2(lg))
+
+        terms = [(SymDivrDiffr(), 'divrW', factor_func1),
+                 (SymDivr(), 'divrdiffrW', factor_func2),
+                 (SymDiffDivr(), 'W', factor_func2)]
+        return self._assemble(beta_mode, 'pol', gaunt_coupling, terms, parity)
+
+    @memoized_block
+    def curl2ss(self, beta_mode: Modes, parity: Tuple = None):
+        def factor_func1(la, lb, lg): return -l2(la)
+        def factor_func2(la, lb, lg): return -l2(lb)
+        def factor_func3(la, lb, lg): return l2(lg)
+
+        terms = [
+                 (SymDivr2Diffr(), 'divrdiffrW', factor_func1),
+                 (SymrDiffDivr2Diffr(), 'divrW', factor_func1),
+                 (SymDivr2(), 'diff2rW', factor_func2),
+                 (SymDiffDivr(), 'divrdiffrW', factor_func2),
+                 (SymDivr2Diffr(), 'divrdiffrW', factor_func3)
+                 ]
+        return self._assemble(beta_mode, 'pol', elsasser_coupling, terms, parity)
+
+    def curl1curltt(self, beta_mode: Modes, parity: Tuple = None):
+        return self.curl1st(beta_mode, parity)
+
+    def curl1curlts(self, beta_mode: Modes, parity: Tuple = None):
+        return self.curl1ss(beta_mode, parity)
+
+    def curl2curltt(self, beta_mode: Modes, parity: Tuple = None):
+        return self.curl2st(beta_mode, parity)
+
+    def curl2curlts(self, beta_mode: Modes, parity: Tuple = None):
+        return self.curl2ss(beta_mode, parity)
+
+    def curl1curlst(self, beta_mode: Modes, parity: Tuple = None):
+        return scsp.csc_matrix(self._shape(parity))
+
+    @memoized_block
+    def curl1curlss(self, beta_mode: Modes, parity: Tuple = None):
+        def factor_func(la, lb, lg):
+            return -l2(lb) * parity_sign(la + lb + lg - 1)
+
+        terms = [(SymDivr(), 'laplacianlW', factor_func)]
+        return self._assemble(beta_mode, 'pol', elsasser_coupling, terms, parity)
+
+    @memoized_block
+    def curl2curlst(self, beta_mode: Modes, parity: Tuple = None):
+        def factor_func(la, lb, lg):
+            return -l2(lg)
+
+        terms = [(SymDivr(), 'laplacianlW', factor_func)]
+        return self._assemble(beta_mode, 'tor', elsasser_coupling, terms, parity)
+
+    @memoized_block
+    def curl2curlss(self, beta_mode: Modes, parity: Tuple = None):
+        def factor_func1(la, lb, lg):
+            return -0.5 * l2(lg) * (l2(la) + l2(lb) - l2(lg))
+        def factor_func2(la, lb, lg):
+            return +0.5 * l2(lb) * (-l2(la) + l2(lb) - l2(lg))
+
+        terms = [(SymDivrDiffr(), 'divrW', factor_func1, 'curl'),
+                 (SymDivr(), 'divrdiffrW', factor_func2, 'curl'),
+                 (SymDiffDivr(), 'laplacianlW', factor_func2)]
+        return self._assemble(beta_mode, 'pol', gaunt_coupling, terms, parity)
 
 
 if __name__ == "__main__":
+    import matplotlib.pyplot as plt
     nr, maxnl, m = 11, 11, 1
     np.set_printoptions(16)
     n_grid = 100
@@ -0,0 +1,50 @@
+""" Ordering of the spectral coefficients at a single m: by l then n, and the equatorial parity classes """
+from functools import lru_cache
+import numpy as np
+
+
+def _read_only(*arrays):
+    for array in arrays:
+        array.flags.writeable = False
+    return arrays if len(arrays) > 1 else arrays[0]
+
+
+def index(nr, m, l, n):
+    """ position of the coefficient (l, n) in a spectrum ordered by l then n, l and n can be arrays """
+    return (np.asarray(l) - m) * nr + np.asarray(n)
+
+
+@lru_cache(maxsize=None)
+def ln_index(nr, maxnl, m, ngalerkin=0):
+    """ degrees l and radial indices n of all the coefficients, with nr - ngalerkin radial modes per l """
+    ls, ns = np.meshgrid(np.arange(m, maxnl), np.arange(nr - ngalerkin), indexing='ij')
+    return _read_only(ls.reshape(-1), ns.reshape(-1))
+
+
+@lru_cache(maxsize=None)
+def parity_idx(nr, maxnl, m, ngalerkin=0):
+    """ idx for parities of a scalar, (l+m) odd (antisymmetric) and (l+m) even (symmetric) """
+    ls, _ = ln_index(nr, maxnl, m, ngalerkin)
+    even = (ls + m) % 2 == 0
+    return _read_only(np.flatnonzero(~even), np.flatnonzero(even))
+
+
+@lru_cache(maxsize=None)
+def component_parity_idx(nr, maxnl, m, component, parity, ngalerkin=0):
+    """ idx of a toroidal or poloidal component in the field of parity 'DP' or 'QP' """
+    if component.lower() not in ('tor', 'pol'):
+        raise RuntimeError(f"Unknown component {component}, must be either 'pol' or 'tor'.")
+    a_idx, s_idx = parity_idx(nr, maxnl, m, ngalerkin)
+    # DP: toroidal with (l+m) even, poloidal with (l+m) odd
+    return s_idx if (component.lower() == 'tor') == (parity.upper() == 'DP') else a_idx
+
+
+@lru_cache(maxsize=None)
+def vector_parity_idx(nr, maxnl, m, parity, ngalerkin=0):
+    """ idx for parity of a vector field """
+    a_idx, s_idx = parity_idx(nr, maxnl, m, ngalerkin)
+    dim = (nr - ngalerkin) * (maxnl - m)
+    if parity.upper() == "DP":
+        return _read_only(np.append(s_idx, dim + a_idx))
+    else:
+        return _read_only(np.append(a_idx, dim + s_idx))
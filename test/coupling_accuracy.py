@@ -0,0 +1,26 @@
+""" This module checks the float64 Gaunt and Elsasser matrices against the sympy reference, up to lb = 40 and m = 120,
+    where a one-directional 3j recursion is no longer stable """
+import time
+import numpy as np
+
+from operators.threeJ_integrals import gaunt_matrix, elsasser_matrix
+
+tol = 1e-12
+worst = 0.
+for lb in [1, 2, 8, 16, 24, 32, 40]:
+    for m in [0, 1, 10, 40, 80, 120]:
+        maxnl = m + 2 * lb + 10
+        for name, matrix in [('gaunt', gaunt_matrix), ('elsasser', elsasser_matrix)]:
+            t0 = time.perf_counter()
+            fast = matrix(maxnl, m, lb)
+            t1 = time.perf_counter()
+            ref = matrix(maxnl, m, lb, backend='sympy')
+            t2 = time.perf_counter()
+            # relative to the largest coupling, absolute if they all vanish (Elsasser, m = 0)
+            scale = np.abs(ref).max()
+            err = np.abs(fast - ref).max() / (scale if scale > 0 else 1.0)
+            worst = max(worst, err)
+            print(f"{name:8s} lb={lb:2d}, m={m:3d}, maxnl={maxnl:3d}: rel. error {err:.1e}, "
+                  f"numpy {t1 - t0:.3f} s, sympy {t2 - t1:.1f} s")
+            assert err < tol, (name, lb, m)
+print(f"worst relative error {worst:.1e}")
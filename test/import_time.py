@@ -0,0 +1,31 @@
+""" This module benchmarks the start-up cost of a worker: importing the package and building a first transform.
+    Each measurement runs in a fresh interpreter, the first run also fills the numba on-disk cache """
+import subprocess
+import sys
+import os
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+heavy = ['matplotlib.pyplot', 'sympy', 'joblib']
+statements = {
+    'import models': "import models",
+    'import fields': "import fields",
+    'first transform': "from operators.worland_transform import WorlandTransform; WorlandTransform(21, 21, 1, 50)",
+}
+code = """
+import sys, time
+t0 = time.perf_counter()
+{statement}
+t1 = time.perf_counter()
+print(t1 - t0, ','.join(name for name in {heavy} if name in sys.modules))
+"""
+
+n_runs = 5
+for name, statement in statements.items():
+    times = []
+    for k in range(n_runs):
+        out = subprocess.run([sys.executable, "-c", code.format(statement=statement, heavy=heavy)],
+                             cwd=root, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(out[0]))
+    loaded = out[1] if len(out) > 1 else 'none'
+    print(f"{name}: first {times[0]:.3f} s, best {min(times[1:]):.3f} s, heavy modules loaded: {loaded}")
@@ -0,0 +1,56 @@
+""" This module benchmarks the accuracy and cost of the Worland operators at high truncations,
+    against the plain (unscaled) recurrence and a multiprecision reference """
+import time
+import numpy as np
+import mpmath
+
+import quicc.geometry.worland.worland_basis as wb
+from operators.polynomials import worland_grid, worland_weight
+from operators.worland_recurrence import worland_operators, jacobiP
+
+mpmath.mp.dps = 60
+
+
+def reference(n, l, r):
+    """ W_n^l and its l-Laplacian at r, in multiprecision """
+    a, b = mpmath.mpf(-0.5), mpmath.mpf(l) - mpmath.mpf(0.5)
+    r = mpmath.mpf(r)
+    x = 2*r**2 - 1
+    norm = mpmath.mpf(wb.worland_norm(n, l))
+    dp = 0.5*(l+n)*mpmath.jacobi(n-1, a+1, b+1, x) if n >= 1 else 0
+    d2p = 0.25*(l+n)*(l+n+1)*mpmath.jacobi(n-2, a+2, b+2, x) if n >= 2 else 0
+    w = norm * r**l * mpmath.jacobi(n, a, b, x)
+    lapl = norm * (16*r**(l+2)*d2p + (8*l+12)*r**l*dp)
+    return w, lapl
+
+
+for nr, l in [(100, 100), (300, 300), (600, 600), (1000, 1000)]:
+    n_grid = nr + l // 2 + 10
+    rg = worland_grid(n_grid)
+    weight = worland_weight(n_grid)
+
+    t0 = time.perf_counter()
+    ops = worland_operators(nr, [l], rg)
+    t1 = time.perf_counter()
+    W, lapl = ops['W'][0], ops['laplacianlW'][0]
+    ortho = np.abs(W.T @ (weight * W) - np.eye(nr)).max()
+
+    # plain recurrence, normalised afterwards
+    with np.errstate(all='ignore'):
+        plain = jacobiP(nr, -0.5, l-0.5, 2*rg**2-1, rg**l) * np.array([wb.worland_norm(n, l) for n in range(nr)])
+        plain_ortho = np.abs(plain.T @ (weight * plain) - np.eye(nr)).max()
+
+    # multiprecision check on a few modes, relative to the largest value of each mode
+    err_w, err_lapl = 0., 0.
+    w_scale = np.maximum(np.abs(W).max(axis=0), np.finfo(float).tiny)
+    lapl_scale = np.maximum(np.abs(lapl).max(axis=0), np.finfo(float).tiny)
+    for n in [0, nr // 2, nr - 1]:
+        for j in np.linspace(0, n_grid - 1, 5).astype(int):
+            w_ref, lapl_ref = reference(n, l, rg[j])
+            err_w = max(err_w, abs(float(w_ref) - W[j, n]) / w_scale[n])
+            err_lapl = max(err_lapl, abs(float(lapl_ref) - lapl[j, n]) / lapl_scale[n])
+
+    print(f"nr={nr}, l={l}: all operators {t1 - t0:.3f} s, "
+          f"|W^T w W - I| = {ortho:.2e} (plain recurrence: {plain_ortho:.2e}, "
+          f"{np.count_nonzero(~np.isfinite(plain))} non-finite), "
+          f"error vs mpmath: W {err_w:.2e}, laplacian {err_lapl:.2e}")
@@ -0,0 +1,32 @@
+""" This module checks the Worland operators on grids containing the origin, as used for m = 0 post-processing:
+    the only non-finite values are the l = 0 entries of divrdiffrW at r = 0, which are singular """
+import numpy as np
+
+from operators.polynomials import _worland, _laplacianlW
+from operators.worland_recurrence import worland_operators
+from operators.worland_transform import WorlandTransform
+
+nr, maxnl, m = 21, 31, 0
+rg = np.linspace(0, 1, 201)
+ls = np.arange(m, maxnl)
+
+ops = worland_operators(nr, ls, rg)
+inner = worland_operators(nr, ls, rg[1:])
+for name, op in ops.items():
+    finite = np.isfinite(op)
+    if name == 'divrdiffrW':
+        assert np.all(~finite[0, 0]) and np.all(finite[1:]) and np.all(finite[:, 1:]), name
+    else:
+        assert np.all(finite), name
+    # away from the origin, the values do not depend on the grid containing it
+    assert np.array_equal(op[:, 1:], inner[name]), name
+
+# limits at the origin, against the per-mode reference
+for i, l in enumerate(ls[:4]):
+    for n in range(nr):
+        assert np.isclose(ops['W'][i, 0, n], _worland(n, l, rg[:1])[0], rtol=1e-10, atol=1e-12), (l, n)
+        assert np.isclose(ops['laplacianlW'][i, 0, n], _laplacianlW(n, l, rg[:1])[0], rtol=1e-10, atol=1e-10), (l, n)
+
+WorlandTransform(5, 6, 0, r_grid=np.linspace(0, 1, 11))
+WorlandTransform(nr, maxnl, m, r_grid=rg)
+print("Worland operators on grids containing r = 0: ok")
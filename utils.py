@@ -3,6 +3,8 @@ import scipy.sparse as scsp
 import scipy.sparse.linalg as spla
 import numpy as np
 from scipy.linalg import eig
+from scipy.sparse.csgraph import connected_components, min_weight_full_bipartite_matching
+from scipy.spatial import cKDTree
 
 
 class Timer(object):
@@ -32,59 +34,165 @@ def single_eig(A, B, target, nev=5, tol=1e-14, v0=None):
     return 1.0 / evals + target, u
 
 
-def full_spectrum(A, B):
-    if scsp.issparse(A): A = A.todense()
-    if scsp.issparse(B): B = B.todense()
-    w = eig(A, B, right=False)
-
-    def f(arr):
-        return np.abs(np.imag(arr))
+def decoupled_blocks(A, B, min_size=32):
+    """
+    idx of the decoupled blocks of the pencil (A, B), the connected components of the graph of the nonzeros of
+    both, e.g. the parities or the components that do not interact at m = 0.
+    Components with less than min_size rows are gathered in one block, to save the overhead of many small solves.
+    """
+    pattern = abs(scsp.csr_matrix(A)) + abs(scsp.csr_matrix(B))
+    pattern.eliminate_zeros()
+    n_comp, labels = connected_components(pattern, directed=False)
+    sizes = np.bincount(labels)
+    labels = np.where(sizes[labels] < min_size, n_comp, labels)
+    order = np.argsort(labels, kind='stable')
+    return np.split(order, np.flatnonzero(np.diff(labels[order])) + 1)
+
+
+def full_spectrum(A, B, blocks=True):
+    """
+    all the finite eigenvalues of A x = w B x, sorted by |imag|.
+    With blocks, the decoupled blocks of the pencil are solved separately, densifying one block at a time.
+    """
+    if blocks:
+        A, B = scsp.csr_matrix(A), scsp.csr_matrix(B)
+        w = []
+        for idx in decoupled_blocks(A, B):
+            a = A[idx, :][:, idx].toarray()
+            b = B[idx, :][:, idx].toarray()
+            w.append(eig(a, b, right=False, overwrite_a=True, overwrite_b=True, check_finite=False))
+        w = np.concatenate(w).astype(np.complex128)
+    else:
+        A = A.toarray() if scsp.issparse(A) else np.array(A)
+        B = B.toarray() if scsp.issparse(B) else np.array(B)
+        w = eig(A, B, right=False, overwrite_a=True, overwrite_b=True, check_finite=False).astype(np.complex128)
 
     w[np.abs(w) > 1e+10] = np.inf
     w = w[~np.isinf(np.abs(w))]
-    w = np.array(sorted(w, key=f), dtype=np.complex128)
-    return w
-
-
-def parity_idx(nr, maxnl, m):
-    """ idx for parities of a scalar """
-    a_idx, s_idx = np.array([], dtype=int), np.array([], dtype=int)
-    k = 0
-    for l in range(m, maxnl):
-        if (l + m) % 2 == 0:
-            for n in range(0, nr):
-                s_idx = np.append(s_idx, np.array([k], dtype=int))
-                k += 1
-        else:
-            for n in range(0, nr):
-                a_idx = np.append(a_idx, np.array([k], dtype=int))
-                k += 1
-    return a_idx, s_idx
-
-
-def vector_parity_idx(nr, maxnl, m, parity, ngalerkin=0):
-    """ idx for parity of a vector field """
-    a_idx, s_idx = parity_idx(nr-ngalerkin, maxnl, m)
-    dim = (nr-ngalerkin) * (maxnl - m)
-    if parity == "DP":
-        return np.append(s_idx, dim + a_idx)
-    else:
-        return np.append(a_idx, dim + s_idx)
-
-
-def reciprocal(w1, w2):
+    return w[np.argsort(np.abs(np.imag(w)), kind='stable')]
+
+
+def _separation(w, n=2):
+    """ "intermodel separation": mean distance of each eigenvalue to the first n of the spectrum """
+    return np.abs(w[:n, np.newaxis] - w[np.newaxis, :]).sum(axis=0) / n
+
+
+def _greedy_match(w1, w2, k=8):
+    """
+    w1[j] takes the nearest eigenvalue of w2 not taken by w1[:j], as the argmin / np.delete loop did.
+    The candidates come from a KD-tree in the complex plane; when all of the k nearest are taken, or the nearest
+    free one is not strictly closer than the k-th, the free part of w2 is searched in full.
+    """
+    tree = cKDTree(np.column_stack([w2.real, w2.imag]))
+    k = min(k, w2.shape[0])
+    dist, nbr = tree.query(np.column_stack([w1.real, w1.imag]), k=k)
+    dist, nbr = dist.reshape(w1.shape[0], k), nbr.reshape(w1.shape[0], k)
+    taken = np.zeros(w2.shape[0], dtype=bool)
+    idx = np.full(w1.shape[0], -1)
+    for j in range(min(w1.shape[0], w2.shape[0])):
+        # lowest index first, so that argmin breaks ties as on the original array
+        cand = np.sort(nbr[j][~taken[nbr[j]]])
+        if cand.shape[0] > 0:
+            d = np.abs(w2[cand] - w1[j])
+            i = np.argmin(d)
+            if k == w2.shape[0] or d[i] < dist[j, -1] * (1 - 1e-12):
+                idx[j] = cand[i]
+                taken[cand[i]] = True
+                continue
+        free = np.flatnonzero(~taken)
+        idx[j] = free[np.argmin(np.abs(w2[free] - w1[j]))]
+        taken[idx[j]] = True
+    return idx
+
+
+def _optimal_match(w1, w2, k=8):
+    """
+    w1[j] matched to w2[idx[j]] with the least total distance, over the graph of the k nearest neighbours,
+    which is widened until a full matching exists.
+    """
+    tree = cKDTree(np.column_stack([w2.real, w2.imag]))
+    pts = np.column_stack([w1.real, w1.imag])
+    while True:
+        k = min(k, w2.shape[0])
+        dist, nbr = tree.query(pts, k=k)
+        rows = np.repeat(np.arange(w1.shape[0]), k)
+        # explicit zeros are not edges, and shifting all the weights leaves the full matchings in the same order
+        graph = scsp.csr_matrix((dist.reshape(-1) + np.finfo(float).tiny, (rows, nbr.reshape(-1))),
+                                shape=(w1.shape[0], w2.shape[0]))
+        try:
+            row, col = min_weight_full_bipartite_matching(graph)
+        except ValueError:
+            if k == w2.shape[0]:
+                raise
+            k *= 2
+            continue
+        idx = np.full(w1.shape[0], -1)
+        idx[row] = col
+        return idx
+
+
+def match_eigenvalues(w1, w2, optimal=False, k=8):
+    """
+    idx such that w1[j] is matched to w2[idx[j]], -1 when w2 has run out of eigenvalues.
+
+    Parameters
+    -----
+    w1, w2: eigenvalues at two truncations
+    optimal: False, nearest free eigenvalue in the order of w1 (as in reciprocal);
+        True, assignment minimising the sum of the distances
+    k: number of nearest neighbours searched first
+    """
+    w1, w2 = np.asarray(w1, dtype=np.complex128), np.asarray(w2, dtype=np.complex128)
+    if w1.shape[0] == 0 or w2.shape[0] == 0:
+        return np.full(w1.shape[0], -1)
+    if optimal:
+        return _optimal_match(w1, w2, k)
+    return _greedy_match(w1, w2, k)
+
+
+def reciprocal(w1, w2, optimal=False):
     """ compute the reciprocal of difference of eigenvalues at two truncations """
+    w1, w2 = np.asarray(w1, dtype=np.complex128), np.asarray(w2, dtype=np.complex128)
     # compute "intermodel separation"
-    sigma = np.zeros((w1.shape[0],))
-    n = 2
-    for k in range(w1.shape[0]):
-        sigma[k] = np.sum(np.abs(w1 - w1[k])[0:n]) / n
+    sigma = _separation(w1)
     # compute the "nearest" difference
-    delta = np.zeros((w1.shape[0]-1,))
-    for k in range(0, w1.shape[0]-1):
-        i = np.argmin(np.abs(w2 - w1[k]))
-        delta[k] = np.abs(w2[i] - w1[k]) / sigma[k]
-        w2 = np.delete(w2, i)
-    # compute and plot reciprocal
+    idx = match_eigenvalues(w1[:-1], w2, optimal=optimal)
+    if np.any(idx < 0):
+        raise RuntimeError(f"Cannot match {w1.shape[0] - 1} eigenvalues with {w2.shape[0]}.")
+    delta = np.abs(w2[idx] - w1[:-1]) / sigma[:-1]
     reci = 1.0 / delta
     return reci
+
+
+def converged_eigenvalues(spectra, threshold=1e+3, optimal=False):
+    """
+    eigenvalues converged across truncations.
+
+    Each eigenvalue of the lowest truncation is followed through the matchings between consecutive truncations,
+    its confidence being the smallest reciprocal of difference along the way.
+
+    Parameters
+    -----
+    spectra: eigenvalues at increasing truncations, each sorted as returned by full_spectrum
+    threshold: least confidence of a converged eigenvalue
+    optimal: matching used between truncations, see match_eigenvalues
+
+    Returns
+    -----
+    eigenvalues at the highest truncation and their confidence, by decreasing confidence
+    """
+    assert len(spectra) >= 2
+    spectra = [np.asarray(w, dtype=np.complex128) for w in spectra]
+    pos = np.arange(spectra[0].shape[0])
+    confidence = np.full(spectra[0].shape[0], np.inf)
+    for w1, w2 in zip(spectra[:-1], spectra[1:]):
+        sigma = _separation(w1)
+        idx = match_eigenvalues(w1[pos], w2, optimal=optimal)
+        found = idx >= 0
+        pos, idx, confidence = pos[found], idx[found], confidence[found]
+        with np.errstate(divide='ignore'):
+            confidence = np.minimum(confidence, sigma[pos] / np.abs(w2[idx] - w1[pos]))
+        pos = idx
+    converged = confidence > threshold
+    order = np.argsort(-confidence[converged], kind='stable')
+    return spectra[-1][pos[converged]][order], confidence[converged][order]